@@ -0,0 +1,176 @@
+# admission.py - DJ_TET kiểm soát tải: token bucket theo user / guild, ngân sách chạy song song có ưu tiên, từ chối sớm khi quá tải
+import asyncio
+import contextvars
+import heapq
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import metrics
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', '0.2'))  # lệnh nặng / giây mỗi user
+ADMISSION_USER_BURST = float(os.getenv('ADMISSION_USER_BURST', '5'))
+ADMISSION_GUILD_RATE = float(os.getenv('ADMISSION_GUILD_RATE', '1'))
+ADMISSION_GUILD_BURST = float(os.getenv('ADMISSION_GUILD_BURST', '15'))
+ADMISSION_MAX_STREAMS = int(os.getenv('ADMISSION_MAX_STREAMS', '0'))  # số FFmpeg tối đa trên node, 0 = không giới hạn
+ADMISSION_MAX_BUCKETS = 10000
+
+# Ưu tiên: số nhỏ chạy trước
+PLAY_NOW = 0  # bài sắp phát / tua: người nghe đang chờ im lặng
+INTERACTIVE = 1  # /play, /search: người dùng đang chờ phản hồi
+BACKGROUND = 2  # prefetch, nhập playlist, làm mới cache
+PRIORITY_NAMES = ('play_now', 'interactive', 'background')
+
+priority = contextvars.ContextVar('dj_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def with_priority(level):
+    # Task tạo bên trong kế thừa ưu tiên (contextvars được copy khi create_task)
+    token = priority.set(level)
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class RateLimited(Overloaded):
+    def __init__(self, retry_after):
+        super().__init__(f"Chậm lại chút nhé! Thử lại sau {math.ceil(retry_after)} giây.")
+        self.retry_after = retry_after
+
+
+# === TOKEN BUCKET ===
+class RateLimiter:
+    def __init__(self, rate, burst, max_keys=ADMISSION_MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, thời điểm cập nhật), LRU
+
+    def wait(self, key, now, cost=1):
+        # Số giây phải chờ để đủ token (0 = được phép), chưa trừ token
+        tokens, stamp = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+        return 0.0 if tokens >= cost else (cost - tokens) / self.rate
+
+    def take(self, key, now, cost=1):
+        tokens, stamp = self.buckets.pop(key, (self.burst, now))
+        self.buckets[key] = (min(self.burst, tokens + (now - stamp) * self.rate) - cost, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)  # lâu không dùng thì bucket đã đầy lại, bỏ đi không mất gì
+
+
+# === NGÂN SÁCH CHẠY SONG SONG ===
+class PriorityBudget:
+    # Như Semaphore nhưng người chờ được xếp theo ưu tiên; hàng chờ đầy hoặc chắc chắn trễ deadline thì từ chối ngay
+    def __init__(self, name, capacity, max_waiting, error=Overloaded):
+        self.name = name
+        self.capacity = capacity
+        self.limits = (max_waiting, max_waiting, max(1, max_waiting // 2))  # việc nền bị cắt trước
+        self.error = error
+        self.active = 0
+        self.waiters = []  # heap (priority, seq, future)
+        self.avg = None  # thời gian trung bình một việc (EWMA)
+        self._seq = 0
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, f in self.waiters if not f.done())
+
+    def saturated(self, level):
+        return self.waiting >= self.limits[level]
+
+    def _shed(self, level, reason):
+        metrics.inc('dj_admission_shed_total', kind='', budget=self.name, priority=PRIORITY_NAMES[level], reason=reason)
+        raise self.error("DJ_TET đang bận, thử lại sau nhé!")
+
+    async def acquire(self, level, timeout=None):
+        if self.active < self.capacity and not self.waiting:
+            self.active += 1
+            return
+        ahead = sum(1 for p, _, f in self.waiters if p <= level and not f.done())
+        if ahead >= self.limits[level]:
+            self._shed(level, 'queue_full')
+        if timeout and self.avg and (ahead // self.capacity + 1) * self.avg > timeout:
+            self._shed(level, 'deadline')  # chờ tới lượt cũng hết giờ: báo ngay thay vì để timeout
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self.waiters, (level, self._seq, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # vừa được nhường slot thì bị hủy: nhường tiếp
+            else:
+                future.cancel()
+            raise
+
+    def release(self, elapsed=None):
+        if elapsed is not None:
+            self.avg = elapsed if self.avg is None else 0.8 * self.avg + 0.2 * elapsed
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)  # nhường thẳng slot, active giữ nguyên
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {'active': self.active, 'waiting': self.waiting, 'capacity': self.capacity}
+
+
+class Admission:
+    def __init__(self):
+        self.users = RateLimiter(ADMISSION_USER_RATE, ADMISSION_USER_BURST)
+        self.guilds = RateLimiter(ADMISSION_GUILD_RATE, ADMISSION_GUILD_BURST)
+        self.budgets = {}
+
+    def budget(self, name, capacity, max_waiting, error=Overloaded):
+        budget = self.budgets[name] = PriorityBudget(name, capacity, max_waiting, error)
+        return budget
+
+    def _reject(self, kind, reason, error, budget=''):
+        # Cùng bộ label với PriorityBudget._shed: lệnh slash không có budget, luôn là INTERACTIVE
+        metrics.inc('dj_admission_shed_total', kind=kind, budget=budget, priority=PRIORITY_NAMES[INTERACTIVE],
+                    reason=reason)
+        raise error
+
+    def admit(self, interaction, kind, cost=1):
+        # Gọi trước khi defer: bị từ chối thì trả lời ngay, không để người dùng chờ tới timeout
+        now = time.monotonic()
+        user_id, guild_id = interaction.user.id, interaction.guild.id
+        wait = max(self.users.wait(user_id, now, cost), self.guilds.wait(guild_id, now, cost))
+        if wait:
+            reason = 'user_rate' if self.users.wait(user_id, now, cost) else 'guild_rate'
+            self._reject(kind, reason, RateLimited(wait))
+        for budget in self.budgets.values():
+            if budget.saturated(INTERACTIVE):
+                self._reject(kind, 'saturated', Overloaded("DJ_TET đang quá tải, thử lại sau ít phút nhé!"), budget.name)
+        if kind == 'play' and ADMISSION_MAX_STREAMS:
+            from player import ffmpeg_sources  # import muộn: player import extractor -> admission
+            vc = interaction.guild.voice_client
+            if not (vc and vc.is_playing()) and len(ffmpeg_sources) >= ADMISSION_MAX_STREAMS:
+                self._reject(kind, 'streams', Overloaded("DJ_TET đang phát cho quá nhiều server, thử lại sau nhé!"))
+        self.users.take(user_id, now, cost)
+        self.guilds.take(guild_id, now, cost)
+        metrics.inc('dj_admission_admitted_total', kind=kind)
+
+    def stats(self):
+        rows = {'user_buckets': len(self.users.buckets), 'guild_buckets': len(self.guilds.buckets)}
+        for name, budget in self.budgets.items():
+            rows.update({f"{name}_{key}": value for key, value in budget.stats().items()})
+        return rows
+
+
+admission = Admission()
@@ -0,0 +1,247 @@
+# audio_cache.py - DJ_TET cache audio trên đĩa: mỗi bài một file Ogg/Opus đã encode sẵn
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+import discord
+from discord.oggparse import OggStream
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', '')  # để trống = tắt cache audio
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+AUDIO_CACHE_MAX_DURATION = int(os.getenv('AUDIO_CACHE_MAX_DURATION', '900'))  # bài dài hơn 15 phút không cache
+AUDIO_CACHE_FILLS = int(os.getenv('AUDIO_CACHE_FILLS', '2'))  # số FFmpeg tải về cùng lúc
+AUDIO_CACHE_BITRATE = int(os.getenv('AUDIO_CACHE_BITRATE', '128'))
+
+
+class OggOpusFile(discord.AudioSource):
+    # Đọc thẳng packet Opus từ file Ogg và gửi cho voice client: không FFmpeg, không encode
+    def __init__(self, path, on_close=None, start=0):
+        self._file = open(path, 'rb')
+        self._packets = OggStream(self._file).iter_packets()
+        self._on_close = on_close
+        self._skip = int(start * 1000 / discord.opus.Encoder.FRAME_LENGTH)  # mỗi packet 20ms
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        for packet in self._packets:
+            if packet.startswith((b'OpusHead', b'OpusTags')):
+                continue
+            if self._skip > 0:
+                self._skip -= 1  # tua tới vị trí bắt đầu (chạy trên thread audio)
+                continue
+            return packet
+        return b''
+
+    def cleanup(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if self._on_close:
+                self._on_close()
+
+
+class CachedPlayer(OggOpusFile):
+    def __init__(self, path, entry, on_close=None, start=0):
+        super().__init__(path, on_close, start)
+        self.title = entry.get('title', 'Unknown')
+        self.duration = entry.get('duration', 0)
+
+    def warm_up(self):
+        return True  # file local, không cần mở trước
+
+
+class AudioCache:
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = {}  # video_id -> {'title', 'duration', 'gain', 'size', 'last_used', 'hits'}
+        self.readers = {}  # video_id -> số source đang đọc file (không được xoá)
+        self.filling = set()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fill_slots = None
+        self._loaded = False
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.opus")
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def load(self):
+        if not self.enabled or self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._index_path(), encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.part'):
+                os.remove(os.path.join(self.directory, name))  # file ghi dở từ lần chạy trước
+            elif name.endswith('.opus'):
+                video_id = name[:-5]
+                if video_id in saved:
+                    entry = saved[video_id]
+                    entry['size'] = os.path.getsize(self.path(video_id))
+                    self.entries[video_id] = entry
+                    self.bytes += entry['size']
+        logger.info(f"Audio cache: {len(self.entries)} bài, {self.bytes / 1024 ** 2:.0f} MB")
+
+    def _save_index(self, snapshot):
+        tmp = f"{self._index_path()}.{uuid.uuid4().hex}.part"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, self._index_path())
+
+    # === ĐỌC ===
+    def lookup(self, video_id, gain):
+        if not self.enabled:
+            return None
+        entry = self.entries.get(video_id)
+        # File encode với gain khác (đổi PLAYER_VOLUME) coi như miss
+        if entry is None or entry.get('gain') != gain:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry['hits'] = entry.get('hits', 0) + 1
+        entry['last_used'] = time.time()
+        return entry
+
+    def has(self, video_id, gain):
+        entry = self.entries.get(video_id)
+        return entry is not None and entry.get('gain') == gain
+
+    def open(self, video_id, gain, start=0):
+        entry = self.lookup(video_id, gain)
+        if entry is None:
+            return None
+        try:
+            self.readers[video_id] = self.readers.get(video_id, 0) + 1
+            return CachedPlayer(self.path(video_id), entry, on_close=lambda: self._release(video_id), start=start)
+        except OSError as e:
+            self._release(video_id)
+            logger.warning(f"Không mở được file cache {video_id}: {e}")
+            self._drop(video_id)
+            return None
+
+    def _release(self, video_id):
+        count = self.readers.get(video_id, 0) - 1
+        if count > 0:
+            self.readers[video_id] = count
+        else:
+            self.readers.pop(video_id, None)
+
+    # === GHI ===
+    def wants(self, video_id, duration, gain):
+        # File cũ encode với gain khác (vd. trước khi có chuẩn hoá loudness) thì encode lại
+        entry = self.entries.get(video_id)
+        return (self.enabled and (entry is None or entry.get('gain') != gain) and video_id not in self.filling
+                and video_id not in self.readers and 0 < (duration or 0) <= AUDIO_CACHE_MAX_DURATION)
+
+    def fill(self, data, gain, executable):
+        # Chạy nền sau khi bài được phát lần đầu; data là kết quả resolver.extract
+        if not self.wants(data.get('id'), data.get('duration'), gain):
+            return
+        self.filling.add(data['id'])
+        asyncio.create_task(self._fill(data, gain, executable))
+
+    async def _fill(self, data, gain, executable):
+        video_id = data['id']
+        if self._fill_slots is None:
+            self._fill_slots = asyncio.Semaphore(AUDIO_CACHE_FILLS)
+        tmp = os.path.join(self.directory, f"{video_id}.{uuid.uuid4().hex}.part")
+        if gain == 1.0 and data.get('acodec') == 'opus':
+            codec = ['-c:a', 'copy']
+        else:
+            codec = ['-filter:a', f'volume={gain}', '-c:a', 'libopus', '-b:a', f'{AUDIO_CACHE_BITRATE}k',
+                     '-ar', '48000', '-ac', '2', '-frame_duration', '20']
+        try:
+            async with self._fill_slots:
+                proc = await asyncio.create_subprocess_exec(
+                    executable, '-nostdin', '-loglevel', 'error',
+                    '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                    '-i', data['url'], '-vn', '-map_metadata', '-1', *codec, '-f', 'ogg', tmp,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+                _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError(stderr.decode(errors='ignore')[-200:])
+            # Ghi xong mới đổi tên: người đọc không bao giờ thấy file dở
+            os.replace(tmp, self.path(video_id))
+            size = os.path.getsize(self.path(video_id))
+            old = self.entries.get(video_id)
+            if old is not None:
+                self.bytes -= old['size']
+            self.entries[video_id] = {
+                'title': data.get('title', 'Unknown'),
+                'duration': data.get('duration', 0),
+                'gain': gain,
+                'size': size,
+                'last_used': time.time(),
+                'hits': 0,
+            }
+            self.bytes += size
+            self._evict()
+            await asyncio.to_thread(self._save_index, {k: dict(v) for k, v in self.entries.items()})
+            logger.info(f"Đã cache audio: {data.get('title')} ({size / 1024:.0f} KB)")
+        except Exception as e:
+            logger.warning(f"Cache audio thất bại {video_id}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        finally:
+            self.filling.discard(video_id)
+
+    # === DỌN ===
+    def _evict(self):
+        if self.bytes <= self.max_bytes:
+            return
+        # LRU, nhưng bài chỉ nghe 1 lần bị xoá trước bài được nghe lại nhiều lần
+        victims = sorted(
+            (k for k in self.entries if k not in self.readers),
+            key=lambda k: (self.entries[k].get('hits', 0) > 1, self.entries[k]['last_used']))
+        for video_id in victims:
+            if self.bytes <= self.max_bytes:
+                break
+            self._drop(video_id)
+            self.evictions += 1
+
+    def _drop(self, video_id):
+        entry = self.entries.pop(video_id, None)
+        if entry is None:
+            return
+        self.bytes -= entry['size']
+        try:
+            os.remove(self.path(video_id))
+        except OSError as e:
+            logger.warning(f"Không xoá được file cache {video_id}: {e}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'readers': sum(self.readers.values()),
+        }
+
+
+audio_cache = AudioCache()
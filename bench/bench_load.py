@@ -0,0 +1,467 @@
+# bench/bench_load.py - Load test offline: chạy lệnh slash thật với Discord / YouTube / FFmpeg giả lập
+#
+# Chạy: python bench/bench_load.py [--guilds 10,100,1000] [--bot main] [--audio synthetic|ffmpeg --file bai.opus]
+#       python bench/bench_load.py --baseline bench/results/load-20260101-120000.json   # so sánh với lần trước
+#
+# - Interaction, guild, voice channel, voice client: đối tượng giả, voice client đọc source mỗi 20ms
+#   trên một thread riêng giống AudioPlayer của discord.py
+# - resolver (yt-dlp/pytube): kết quả xác định theo query, độ trễ cấu hình được; hàng chờ ưu tiên / shed là code thật
+#   (--resolver-workers 2 --resolver-pending 16 = cấu hình mặc định của node thật, để đo shed khi quá tải)
+# - audio: synthetic = source Opus trong process (đo overhead của bot), ffmpeg = FFmpeg thật đọc file local,
+#   mixed = như synthetic nhưng khoảng nửa số bài là PCM (stream) xen với Opus (cache audio): kiểm tra nối bài
+#   Opus -> PCM trên cùng voice client (encoder chỉ được tạo khi source đầu tiên của vc.play là PCM)
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Tắt những phần chạm tới đĩa / mạng trước khi import bot
+os.environ.setdefault('STATE_DB_PATH', '')
+os.environ.setdefault('AUDIO_CACHE_DIR', '')
+os.environ.setdefault('TRACK_CACHE_PATH', '')
+os.environ.setdefault('SEARCH_INDEX_PATH', '')
+os.environ.setdefault('LOUDNESS_DB_PATH', '')
+os.environ.setdefault('FFMPEG_PATH', 'ffmpeg')
+
+import discord  # noqa: E402
+
+import player  # noqa: E402
+from metrics import metrics  # noqa: E402
+from admission import admission, priority  # noqa: E402
+from extractor import ResolverBusy, resolver  # noqa: E402
+
+FRAME = b'\xfc\xff\xfe' + b'\x00' * 157  # kích thước cỡ một packet Opus 64kbps
+PCM_FRAME = b'\x00' * discord.opus.Encoder.FRAME_SIZE
+FRAME_SECONDS = 0.02
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# === RESOLVER GIẢ ===
+class FakeResolver:
+    # Thay tiến trình yt-dlp/pytube (resolver._submit): cache, singleflight, pending của resolver vẫn là code thật
+    def __init__(self, latency, track_seconds, audio_file, seed=1):
+        self.latency = latency
+        self.track_seconds = track_seconds
+        self.audio_file = audio_file
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def track(self, vid):
+        return {'id': vid, 'title': f"Bài {vid}", 'duration': self.track_seconds,
+                'url': self.audio_file or f"fake://{vid}", 'webpage_url': f"https://www.youtube.com/watch?v={vid}",
+                'acodec': 'opus'}
+
+    def results(self, query, limit):
+        return [self.track(f"{zlib.crc32(f'{query}#{i}'.encode()):011d}"[:11]) for i in range(limit)]
+
+    def handle(self, name, *args):
+        if name == '_extract':
+            return self.track(args[0].rsplit('v=', 1)[-1])
+        if name in ('_search_pytube', '_search_ytdl'):
+            return self.results(*args)
+        if name == '_extract_playlist':
+            url, start, end = args
+            return {'title': 'Playlist', 'entries': self.results(url, end)[start - 1:end]}
+        raise ValueError(name)
+
+    async def submit(self, fn, *args, timeout=None):
+        # Hàng chờ ưu tiên + shed của resolver là code thật, chỉ phần chạy trong pool là giả
+        resolver.pending += 1
+        try:
+            await resolver.budget.acquire(priority.get(), timeout or resolver.timeout)
+            start = time.perf_counter()
+            try:
+                self.calls += 1
+                # Độ trễ lệch ±50% quanh giá trị cấu hình, cố định theo seed
+                await asyncio.sleep(self.latency * (0.5 + self.rng.random()))
+                return self.handle(fn.__name__, *args)
+            finally:
+                resolver.budget.release(time.perf_counter() - start)
+        finally:
+            resolver.pending -= 1
+
+    def install(self, workers, max_pending):
+        # yt-dlp giả không tốn CPU: mặc định cho nhiều slot hơn node thật để bench đo phát nhạc, không đo shed
+        resolver.workers = workers
+        resolver.max_pending = max_pending
+        resolver.budget = admission.budget('extract', workers, max_pending, ResolverBusy)
+        resolver._submit = self.submit
+
+
+class SyntheticSource(discord.AudioSource):
+    def __init__(self, data, opus=True):
+        self.title = data['title']
+        self.duration = data['duration']
+        self.left = int(data['duration'] / FRAME_SECONDS)
+        self.opus = opus
+        self.frame = FRAME if opus else PCM_FRAME
+
+    def is_opus(self):
+        return self.opus
+
+    def warm_up(self):
+        return True
+
+    def read(self):
+        if self.left <= 0:
+            return b''
+        self.left -= 1
+        return self.frame
+
+
+def install_synthetic_audio(mixed=False):
+    async def open_source(url, start, mode=None):
+        data = await resolver.extract(url)
+        # mixed: bài "có trong cache audio" (Opus) hay phải stream (PCM), cố định theo video id
+        source = SyntheticSource(data, opus=not mixed or zlib.crc32(data['id'].encode()) % 2 == 0)
+        source.left -= int(start / FRAME_SECONDS)
+        return source
+    player._open_source = open_source
+
+
+# === DISCORD GIẢ ===
+class Stats:
+    def __init__(self):
+        self.commands = {}  # tên lệnh -> [giây]
+        self.first_frame = []
+        self.gaps = []
+        self.streams = 0
+        self.lock = threading.Lock()
+
+    def command(self, name, seconds):
+        self.commands.setdefault(name, []).append(seconds)
+
+
+class NullEncoder:
+    # libopus chưa nạp: vẫn tạo encoder đúng lúc discord.py tạo, chỉ bỏ phần encode thật
+    SAMPLES_PER_FRAME = discord.opus.Encoder.SAMPLES_PER_FRAME
+
+    def encode(self, pcm, frame_size):
+        return pcm
+
+
+class FakeVoiceClient:
+    def __init__(self, guild, channel, stats):
+        self.guild = guild
+        self.channel = channel
+        self.stats = stats
+        self.source = None
+        self.connected = True
+        self.ended_at = None
+        self._stop = None
+        self._resumed = None
+        self.encoder = None
+
+    def is_connected(self):
+        return self.connected
+
+    def is_playing(self):
+        return self._stop is not None and not self._stop.is_set() and self._resumed.is_set()
+
+    def is_paused(self):
+        return self._stop is not None and not self._stop.is_set() and not self._resumed.is_set()
+
+    def play(self, source, after=None):
+        # Như VoiceClient.play: encoder chỉ tạo khi source đầu tiên là PCM, không tạo lại giữa chừng
+        if not source.is_opus():
+            self.encoder = discord.opus.Encoder() if discord.opus.is_loaded() else NullEncoder()
+        self.source = source
+        self._stop = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        threading.Thread(target=self._run, args=(self._stop, self._resumed, after, time.perf_counter()),
+                         daemon=True).start()
+
+    def _run(self, stop, resumed, after, played_at):
+        # Giống AudioPlayer._do_run: đọc một frame mỗi 20ms, encode nếu source là PCM
+        with self.stats.lock:
+            self.stats.streams += 1
+        first = True
+        error = None
+        start, loops = time.perf_counter(), 0
+        try:
+            while not stop.is_set():
+                if not resumed.is_set():
+                    resumed.wait()
+                    start, loops = time.perf_counter(), 0
+                    continue
+                data = self.source.read()
+                if not data:
+                    error = getattr(self.source, '_current_error', None)
+                    break
+                if first:
+                    now = time.perf_counter()
+                    self.stats.first_frame.append(now - played_at)
+                    if self.ended_at is not None:
+                        self.stats.gaps.append(now - self.ended_at)
+                    first = False
+                if not self.source.is_opus():
+                    self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)  # None như MISSING của discord.py
+                loops += 1
+                delay = start + FRAME_SECONDS * loops - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e  # AudioPlayer.run: lỗi trên thread audio dừng phát và được báo qua after
+        finally:
+            with self.stats.lock:
+                self.stats.streams -= 1
+            self.ended_at = time.perf_counter()
+            if after is not None:
+                after(error)
+            self.source.cleanup()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._resumed.set()
+
+    def pause(self):
+        if self._resumed is not None:
+            self._resumed.clear()
+
+    def resume(self):
+        if self._resumed is not None:
+            self._resumed.set()
+
+    async def disconnect(self):
+        self.stop()
+        self.connected = False
+        self.guild.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, stats):
+        self.guild = guild
+        self.id = guild.id * 10
+        self.name = f"voice-{guild.id}"
+        self.stats = stats
+
+    async def connect(self):
+        await asyncio.sleep(0.005)
+        self.guild.voice_client = FakeVoiceClient(self.guild, self, self.stats)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id, stats):
+        self.id = guild_id
+        self.voice_client = None
+        self.voice_channel = FakeVoiceChannel(self, stats)
+
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        self.done = True
+
+
+class FakeFollowup:
+    async def send(self, *args, **kwargs):
+        return FakeMessage()
+
+
+class FakeInteraction:
+    def __init__(self, guild):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = type('User', (), {'id': guild.id, 'voice': type('VoiceState', (), {'channel': guild.voice_channel})()})()
+        self.channel = type('Channel', (), {'id': guild.id * 10 + 1})()
+        self.created_at = discord.utils.utcnow()
+        self.expires_at = self.created_at + datetime.timedelta(minutes=15)
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+    async def original_response(self):
+        return FakeMessage()
+
+
+# === KỊCH BẢN ===
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0.0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def counter_total(metric):
+    return sum(v for (name, _), v in metrics.counters.items() if name == metric)
+
+
+def track_errors():
+    return counter_total('dj_track_errors_total')
+
+
+def shed():
+    return counter_total('dj_admission_shed_total')
+
+
+def children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_command(bot, stats, name, guild, **kwargs):
+    command = bot.tree.get_command(name)
+    start = time.perf_counter()
+    await command.callback(FakeInteraction(guild), **kwargs)
+    stats.command(name, time.perf_counter() - start)
+
+
+async def scenario(bot, count, args, offset):
+    stats = Stats()
+    guilds = {offset + i: FakeGuild(offset + i, stats) for i in range(count)}
+    bot.get_guild = guilds.get
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def limited(name, guild, **kwargs):
+        async with sem:
+            await run_command(bot, stats, name, guild, **kwargs)
+
+    async def each(name, **kwargs):
+        await asyncio.gather(*(limited(name, g, **kwargs) for g in guilds.values()))
+
+    start, errors, rejected = time.perf_counter(), track_errors(), shed()
+    await asyncio.gather(*(limited('play', g, query=f"guild {g.id} bài 0") for g in guilds.values()))
+    for n in range(1, args.tracks):
+        await asyncio.gather(*(limited('play', g, query=f"guild {g.id} bài {n}") for g in guilds.values()))
+    await each('queue')
+    await each('search', query="nhạc tết")
+
+    # Phát ổn định: đo CPU trên cả bot lẫn FFmpeg, thỉnh thoảng /skip để có chuyển bài do người dùng
+    cpu, child, wall = time.process_time(), children_cpu(), time.perf_counter()
+    samples = []
+    rng = random.Random(count)
+    while time.perf_counter() - wall < args.seconds:
+        await asyncio.sleep(0.5)
+        samples.append(stats.streams)
+        for g in rng.sample(list(guilds.values()), max(1, count // 20)):
+            await limited('skip', g)
+    window = time.perf_counter() - wall
+    cpu_s = time.process_time() - cpu + children_cpu() - child
+    active = statistics.mean(samples) if samples else 0
+    memory = rss_mb()
+    await each('stop')
+    await asyncio.sleep(0.1)
+
+    result = {
+        'guilds': count,
+        'elapsed_s': round(time.perf_counter() - start, 3),
+        'commands': {name: {'n': len(v), 'p50_ms': round(percentile(v, 0.5) * 1000, 2),
+                            'p99_ms': round(percentile(v, 0.99) * 1000, 2)}
+                     for name, v in stats.commands.items()},
+        'first_frame_p50_ms': round(percentile(stats.first_frame, 0.5) * 1000, 2),
+        'first_frame_p99_ms': round(percentile(stats.first_frame, 0.99) * 1000, 2),
+        'gap_p50_ms': round(percentile(stats.gaps, 0.5) * 1000, 2),
+        'gap_p99_ms': round(percentile(stats.gaps, 0.99) * 1000, 2),
+        'active_streams': round(active, 1),
+        'track_errors': track_errors() - errors,
+        'shed': shed() - rejected,
+        'cpu_ms_per_stream_s': round(1000 * cpu_s / (active * window), 3) if active else 0.0,
+        'rss_mb': round(memory, 1),
+    }
+    return result
+
+
+def report(result, baseline=None):
+    print(f"\n== {result['guilds']} guild ({result['elapsed_s']}s) ==")
+    for name, c in sorted(result['commands'].items()):
+        print(f"  /{name:<8} n={c['n']:<6} p50 {c['p50_ms']:8.2f} ms  p99 {c['p99_ms']:8.2f} ms")
+    for key in ('first_frame_p50_ms', 'first_frame_p99_ms', 'gap_p50_ms', 'gap_p99_ms',
+                'active_streams', 'track_errors', 'shed', 'cpu_ms_per_stream_s', 'rss_mb'):
+        line = f"  {key:<22} {result[key]}"
+        if baseline is not None and baseline.get(key):
+            change = (result[key] - baseline[key]) * 100 / baseline[key]
+            flag = "  <-- tệ hơn" if change > 10 and key != 'active_streams' else ""
+            line += f"  ({change:+.1f}% so với baseline){flag}"
+        print(line)
+
+
+async def main_async(args):
+    import importlib
+    bot_module = importlib.import_module(args.bot)
+    bot = bot_module.bot
+    logging.getLogger("DJ_TET").setLevel(logging.CRITICAL)  # lỗi được đếm qua metrics, không in ra
+    FakeResolver(args.resolve_ms / 1000, args.track_seconds, args.file).install(args.resolver_workers,
+                                                                                 args.resolver_pending)
+    if args.audio in ('synthetic', 'mixed'):
+        install_synthetic_audio(mixed=args.audio == 'mixed')
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = {r['guilds']: r for r in json.load(f)['results']}
+    results = []
+    for i, count in enumerate(int(c) for c in args.guilds.split(',')):
+        bot_module.players.players.clear()
+        result = await scenario(bot, count, args, offset=(i + 1) * 1_000_000)
+        report(result, baseline.get(count))
+        results.append(result)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    print(f"\nĐã lưu kết quả: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bot', default='main', choices=('main', 'main_v2'))
+    parser.add_argument('--guilds', default='10,100,1000')
+    parser.add_argument('--tracks', type=int, default=3, help="số bài /play mỗi guild")
+    parser.add_argument('--track-seconds', type=float, default=10,
+                        help="đủ dài để các guild còn phát trong lúc đo (3 bài x 10s > --seconds)")
+    parser.add_argument('--seconds', type=float, default=10, help="thời gian phát ổn định để đo CPU")
+    parser.add_argument('--resolve-ms', type=float, default=150, help="độ trễ giả lập của yt-dlp/pytube")
+    parser.add_argument('--concurrency', type=int, default=200, help="số lệnh xử lý cùng lúc")
+    parser.add_argument('--resolver-workers', type=int, default=64,
+                        help="slot trích xuất giả lập (node thật: EXTRACTOR_WORKERS, mặc định 2)")
+    parser.add_argument('--resolver-pending', type=int, default=512,
+                        help="hàng chờ trích xuất (node thật: EXTRACTOR_MAX_PENDING, mặc định 16); nhỏ lại để đo shed")
+    parser.add_argument('--audio', default='synthetic', choices=('synthetic', 'mixed', 'ffmpeg'))
+    parser.add_argument('--file', help="file audio local cho --audio ffmpeg")
+    parser.add_argument('--baseline', help="file kết quả cũ để so sánh")
+    args = parser.parse_args()
+    if args.audio == 'ffmpeg' and not (args.file and os.path.exists(args.file)):
+        sys.exit("--audio ffmpeg cần --file trỏ tới file audio có thật")
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
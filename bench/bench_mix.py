@@ -0,0 +1,152 @@
+# bench/bench_mix.py - Đo chi phí crossfade mỗi frame và underrun khi nhiều guild cùng trộn bài
+#
+# Chạy: python bench/bench_mix.py [--guilds 10,100,300] [--seconds 10] [--track-seconds 6]
+# Cần NumPy (không có NumPy mixer chỉ nối liền bài, không có gì để đo).
+#
+# - Mỗi guild một thread đọc Mixer mỗi 20ms giống AudioPlayer của discord.py, source là PCM giả trong process
+# - Bài ngắn (mặc định 6s với CROSSFADE_SECONDS=5) để phần lớn thời gian mixer đang trộn hai bài
+# - Underrun: frame gửi trễ quá một frame (20ms) so với lịch, bộ đệm jitter phía client bắt đầu cạn
+# - Mỗi số guild chạy hai lần: crossfade 0 (baseline, chỉ nối liền) rồi crossfade thật, so underrun giữa hai lần
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mixer  # noqa: E402
+from mixer import FRAME_SECONDS, Mixer, crossfade  # noqa: E402
+from player import Tracked  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class PCMSource:
+    # PCM s16le stereo ngẫu nhiên, mỗi bài một frame lặp lại (không tính chi phí decode)
+    def __init__(self, duration, seed):
+        self.duration = duration
+        self.left = int(duration / FRAME_SECONDS)
+        self.frame = random.Random(seed).randbytes(mixer.discord.opus.Encoder.FRAME_SIZE)
+
+    def read(self):
+        if self.left <= 0:
+            return b''
+        self.left -= 1
+        return self.frame
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        pass
+
+
+def bench_frame(frames):
+    tail = PCMSource(1, 1).frame
+    head = PCMSource(1, 2).frame
+    steps = round(mixer.CROSSFADE_SECONDS / FRAME_SECONDS) or 1
+    crossfade(tail, head, 0, steps)  # tạo sẵn đường cong
+    costs = []
+    for i in range(frames):
+        start = time.perf_counter()
+        crossfade(tail, head, i % steps, steps)
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+class Guild:
+    def __init__(self, index, track_seconds):
+        self.index = index
+        self.track_seconds = track_seconds
+        self.tracks = 0
+        self.frames = 0
+        self.mixed = 0
+        self.underruns = 0
+        self.late = []
+        self.read_costs = []
+        self.mixer = Mixer(self._track(), self._on_switch)
+        self.mixer.queue_next(None, self._track())
+
+    def _track(self):
+        self.tracks += 1
+        return Tracked(PCMSource(self.track_seconds, self.index * 100000 + self.tracks))
+
+    def _on_switch(self, track, source):
+        self.mixer.queue_next(None, self._track())  # bài kế luôn sẵn: đo riêng chi phí trộn
+
+    def run(self, stop):
+        # Giống AudioPlayer._do_run: lịch gửi cố định 20ms, trễ thì gửi bù không ngủ
+        start, loops = time.perf_counter(), 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            data = self.mixer.read()
+            self.read_costs.append(time.perf_counter() - t0)
+            if not data:
+                break
+            self.frames += 1
+            self.mixed += self.mixer.fading is not None
+            lateness = t0 - (start + FRAME_SECONDS * loops)
+            self.late.append(lateness)
+            if lateness > FRAME_SECONDS:
+                self.underruns += 1
+            loops += 1
+            delay = start + FRAME_SECONDS * loops - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def bench_guilds(count, seconds, track_seconds, crossfade_seconds):
+    mixer.CROSSFADE_SECONDS = crossfade_seconds  # 0 = baseline: cùng số thread / bài, chỉ nối liền
+    guilds = [Guild(i, track_seconds) for i in range(count)]
+    stop = threading.Event()
+    threads = [threading.Thread(target=g.run, args=(stop,), daemon=True) for g in guilds]
+    cpu = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    cpu = time.process_time() - cpu
+    late = [x for g in guilds for x in g.late]
+    costs = [x for g in guilds for x in g.read_costs]
+    frames = sum(g.frames for g in guilds)
+    print(f"\n== {count} guild ({seconds:.0f}s, bài {track_seconds:.0f}s, crossfade {crossfade_seconds:.0f}s) ==")
+    print(f"  frame gửi            {frames} ({100 * sum(g.mixed for g in guilds) / max(1, frames):.0f}% đang trộn)")
+    print(f"  Mixer.read           p50 {percentile(costs, 0.5) * 1e6:7.1f} µs  p99 {percentile(costs, 0.99) * 1e6:7.1f} µs")
+    print(f"  trễ so với lịch      p50 {percentile(late, 0.5) * 1000:7.2f} ms  p99 {percentile(late, 0.99) * 1000:7.2f} ms")
+    print(f"  underrun (>20ms)     {sum(g.underruns for g in guilds)}")
+    print(f"  CPU                  {1000 * cpu / max(1, frames):.3f} ms / frame, {100 * cpu / seconds:.0f}% một core")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--guilds', default='10,100,300')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--track-seconds', type=float, default=6)
+    parser.add_argument('--frames', type=int, default=20000, help="số frame cho phép đo crossfade đơn lẻ")
+    args = parser.parse_args()
+    if mixer.numpy is None:
+        sys.exit("Cần NumPy: pip install numpy")
+
+    costs = bench_frame(args.frames)
+    print(f"crossfade 1 frame (20ms, {mixer.FRAME_SAMPLES * mixer.CHANNELS} mẫu int16): "
+          f"trung bình {statistics.mean(costs) * 1e6:.1f} µs, p99 {percentile(costs, 0.99) * 1e6:.1f} µs "
+          f"({100 * percentile(costs, 0.99) / FRAME_SECONDS:.2f}% ngân sách frame)")
+    crossfade_seconds = mixer.CROSSFADE_SECONDS
+    for count in (int(c) for c in args.guilds.split(',')):
+        # Chạy baseline trước: underrun có sẵn do số thread audio (mỗi voice client một thread), không do trộn
+        bench_guilds(count, args.seconds, args.track_seconds, 0)
+        bench_guilds(count, args.seconds, args.track_seconds, crossfade_seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# bench/bench_player_modes.py - So sánh CPU mỗi stream giữa PLAYER_MODE=pcm và PLAYER_MODE=opus
+#
+# Chạy: python bench/bench_player_modes.py <file_audio> [--streams 8] [--seconds 30]
+# Cần ffmpeg trong PATH (hoặc FFMPEG_PATH) và libopus cho chế độ pcm.
+import argparse
+import os
+import sys
+import time
+
+import discord
+
+try:
+    import resource
+except ImportError:  # Windows: không đo được CPU của tiến trình con
+    resource = None
+
+FFMPEG = os.getenv('FFMPEG_PATH', 'ffmpeg')
+VOLUME = float(os.getenv('PLAYER_VOLUME', '0.5'))
+
+
+def children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def open_pcm(path):
+    source = discord.FFmpegPCMAudio(path, executable=FFMPEG, options=f'-vn -filter:a "volume={VOLUME}"')
+    return discord.PCMVolumeTransformer(source)
+
+
+def open_opus(path):
+    return discord.FFmpegOpusAudio(path, executable=FFMPEG, codec='libopus', options=f'-vn -filter:a "volume={VOLUME}"')
+
+
+def run(mode, path, streams, frames):
+    encoder = discord.opus.Encoder() if mode == 'pcm' else None
+    sources = [open_pcm(path) if mode == 'pcm' else open_opus(path) for _ in range(streams)]
+    cpu_start, child_start, wall_start = time.process_time(), children_cpu(), time.perf_counter()
+    sent = 0
+    for _ in range(frames):
+        for source in sources:
+            data = source.read()
+            if not data:
+                continue
+            if encoder is not None:
+                # Đúng việc AudioPlayer làm với nguồn PCM: mã hoá Opus trong tiến trình bot
+                data = encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            sent += 1
+    for source in sources:
+        source.cleanup()
+    bot_cpu = time.process_time() - cpu_start
+    ffmpeg_cpu = children_cpu() - child_start
+    audio_seconds = sent * 0.02
+    return {
+        'mode': mode,
+        'frames': sent,
+        'wall_s': time.perf_counter() - wall_start,
+        'bot_cpu_ms_per_audio_s': 1000 * bot_cpu / audio_seconds if audio_seconds else 0.0,
+        'ffmpeg_cpu_ms_per_audio_s': 1000 * ffmpeg_cpu / audio_seconds if audio_seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument('--streams', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=30)
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"Không thấy file: {args.path}")
+    frames = int(args.seconds * 50)
+    for mode in ('pcm', 'opus'):
+        r = run(mode, args.path, args.streams, frames)
+        print(f"{r['mode']:>5}: {r['frames']} frames, {r['wall_s']:.2f}s wall, "
+              f"bot {r['bot_cpu_ms_per_audio_s']:.2f} ms CPU / giây audio / stream, "
+              f"ffmpeg {r['ffmpeg_cpu_ms_per_audio_s']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# bench/bench_state_recovery.py - Đo thời gian ghi / nạp / khôi phục state cho nhiều guild
+#
+# Chạy: python bench/bench_state_recovery.py [--guilds 1000] [--tracks 50]
+# Không cần Discord: dùng DB tạm, đo phần bot tự làm (vào lại voice phụ thuộc gateway Discord).
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from guild_player import GuildPlayer  # noqa: E402
+from state_store import StateStore  # noqa: E402
+from track_queue import Track  # noqa: E402
+
+
+class FakeRegistry:
+    bot = None
+    on_track_start = None
+    on_idle = None
+
+
+def snapshots(guilds, tracks):
+    now = time.time()
+    for g in range(guilds):
+        queue = [Track(f"{g:05d}{i:06d}", f"Bài hát số {i} - Ca sĩ {g}", 180 + i) for i in range(tracks)]
+        current = (f"{g:05d}cur", "Bài đang phát", 240, 60.0, now, False)
+        yield g, 1000 + g, g % 3, {'auto_now_playing_channel': 5000 + g}, current, queue
+
+
+async def run(guilds, tracks):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.db')
+        writer = StateStore(path)
+        data = list(snapshots(guilds, tracks))
+        start = time.perf_counter()
+        writer._write(data, time.time())
+        write_s = time.perf_counter() - start
+        writer._db.close()
+
+        store = StateStore(path)
+        start = time.perf_counter()
+        await store.load()
+        load_s = time.perf_counter() - start
+
+        registry = FakeRegistry()
+        start = time.perf_counter()
+        players = []
+        for g in range(guilds):
+            gp = GuildPlayer(registry, g)
+            gp.pending_resume = store.restore(gp)
+            players.append(gp)
+        hydrate_s = time.perf_counter() - start
+
+        assert all(len(gp.queue) == tracks and gp.pending_resume[1] for gp in players)
+        print(f"{guilds} guild x {tracks} bài: ghi {write_s * 1000:.0f} ms, nạp DB {load_s * 1000:.0f} ms, "
+              f"parse queue {hydrate_s * 1000:.0f} ms (tổng khôi phục {(load_s + hydrate_s) * 1000:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--tracks', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.guilds, args.tracks))
+
+
+if __name__ == '__main__':
+    main()
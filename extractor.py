@@ -0,0 +1,255 @@
+# extractor.py - DJ_TET resolver: chạy yt-dlp / pytube trong pool tiến trình riêng
+import asyncio
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import discord
+
+from admission import BACKGROUND, Overloaded, admission, priority, with_priority
+from metrics import metrics
+from singleflight import SingleFlight, normalize_query
+from track_cache import track_cache
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+EXTRACTOR_WORKERS = int(os.getenv('EXTRACTOR_WORKERS', '2'))
+EXTRACTOR_TIMEOUT = float(os.getenv('EXTRACTOR_TIMEOUT', '20'))
+EXTRACTOR_MAX_PENDING = int(os.getenv('EXTRACTOR_MAX_PENDING', '16'))  # số việc chờ tối đa (việc nền: một nửa)
+
+YTDL_OPTIONS = {
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'source_address': '0.0.0.0',
+}
+
+SEARCH_OPTIONS = {
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'extract_flat': True,
+    'skip_download': True
+}
+
+PLAYLIST_OPTIONS = {
+    'quiet': True,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+    'skip_download': True
+}
+
+# === WORKER (chạy trong tiến trình con) ===
+# Mỗi tiến trình giữ một YoutubeDL riêng, tạo lần đầu khi cần
+_ytdl = None
+_ytdl_formats = {}  # định dạng dự phòng khi failover -> YoutubeDL
+
+
+def _get_ytdl(fmt=None):
+    global _ytdl
+    if fmt is not None:
+        if fmt not in _ytdl_formats:
+            import yt_dlp
+            _ytdl_formats[fmt] = yt_dlp.YoutubeDL(dict(YTDL_OPTIONS, format=fmt))
+        return _ytdl_formats[fmt]
+    if _ytdl is None:
+        import yt_dlp
+        _ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+    return _ytdl
+
+
+def _slim(info):
+    # Chỉ gửi về những trường bot dùng, tránh pickle cả dict info khổng lồ
+    video_id = info.get('id')
+    return {
+        'id': video_id,
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration') or 0,
+        'url': info.get('url'),
+        'webpage_url': info.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}",
+        'acodec': info.get('acodec'),
+    }
+
+
+def _warm_up():
+    # Import yt-dlp / pytube và tạo YoutubeDL trước, để /play đầu tiên không phải chờ
+    _get_ytdl()
+    import pytube  # noqa: F401
+    return os.getpid()
+
+
+def _extract(url, fmt=None):
+    return _slim(_get_ytdl(fmt).extract_info(url, download=False))
+
+
+def _search_pytube(query, limit):
+    from pytube import Search
+    results = []
+    for video in (Search(query).results or [])[:limit]:
+        results.append({
+            'id': video.video_id,
+            'title': video.title,
+            'duration': video.length or 0,
+            'url': f"https://www.youtube.com/watch?v={video.video_id}",
+        })
+    return results
+
+
+def _search_ytdl(query, limit):
+    import yt_dlp
+    with yt_dlp.YoutubeDL(SEARCH_OPTIONS) as ydl:
+        info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+    results = []
+    for entry in (info.get('entries') or [])[:limit]:
+        results.append({
+            'id': entry.get('id'),
+            'title': entry.get('title', 'Unknown'),
+            'duration': entry.get('duration') or 0,
+            'url': entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}",
+        })
+    return results
+
+
+def _extract_playlist(url, start, end):
+    # Chỉ lấy metadata (flat) của các mục start..end, stream URL resolve sau khi sắp phát
+    import yt_dlp
+    with yt_dlp.YoutubeDL(dict(PLAYLIST_OPTIONS, playlist_items=f"{start}-{end}")) as ydl:
+        info = ydl.extract_info(url, download=False)
+    entries = []
+    for entry in info.get('entries') or []:
+        if entry and entry.get('id'):
+            entries.append({
+                'id': entry['id'],
+                'title': entry.get('title', 'Unknown'),
+                'duration': entry.get('duration') or 0,
+            })
+    return {'title': info.get('title', 'Playlist'), 'entries': entries}
+
+
+# === RESOLVER (chạy trên event loop) ===
+VIDEO_ID_RE = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([0-9A-Za-z_-]{11})')
+
+
+class ResolverBusy(Overloaded):
+    pass
+
+
+def video_id(url):
+    match = VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def time_left(interaction, timeout=None):
+    # Interaction token hết hạn sau 15 phút, không chờ quá thời điểm đó
+    timeout = timeout or EXTRACTOR_TIMEOUT
+    if interaction is None:
+        return timeout
+    remaining = (interaction.expires_at - discord.utils.utcnow()).total_seconds()
+    if remaining <= 0:
+        raise asyncio.TimeoutError("Interaction đã hết hạn")
+    return min(timeout, remaining)
+
+
+class Resolver:
+    def __init__(self, workers=EXTRACTOR_WORKERS, timeout=EXTRACTOR_TIMEOUT, max_pending=EXTRACTOR_MAX_PENDING,
+                 cache=track_cache):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.pending = 0  # đang chạy + đang chờ slot
+        # Pool chỉ nhận đúng số việc bằng số worker, phần còn lại xếp theo ưu tiên ở đây thay vì FIFO trong pool
+        self.budget = admission.budget('extract', workers, max_pending, ResolverBusy)
+        self._executor = None
+        self._refresh_task = None
+
+    def start(self):
+        # Gọi từ on_ready; on_ready chạy lại mỗi lần reconnect nên chỉ khởi động một lần
+        if self._refresh_task is None:
+            self.cache.shared.start()
+            self.cache.load()
+            self._refresh_task = asyncio.create_task(self.cache.refresh_loop(self._refresh_background))
+
+    async def warm_up(self):
+        # Chạy nền lúc khởi động; không tính vào pending nên không chặn lệnh của người dùng
+        start = time.perf_counter()
+        jobs = [asyncio.wrap_future(self._pool().submit(_warm_up)) for _ in range(self.workers)]
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        pids = {r for r in results if not isinstance(r, BaseException)}
+        logger.info(f"Pool trích xuất sẵn sàng: {len(pids)} tiến trình, {time.perf_counter() - start:.2f}s")
+
+    def _pool(self):
+        # Tạo lười để tiến trình con (spawn trên Windows) không tự tạo pool
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _submit(self, fn, *args, timeout=None):
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        self.pending += 1
+        try:
+            # Hàng chờ đầy / chắc chắn trễ hạn thì ResolverBusy ngay; thời gian chờ slot tính vào timeout
+            await asyncio.wait_for(self.budget.acquire(priority.get(), timeout), timeout)
+            start = time.perf_counter()
+            try:
+                future = self._pool().submit(fn, *args)
+                # wait_for hủy wrapper khi timeout/cancel, wrapper hủy luôn job nếu job chưa chạy
+                return await asyncio.wait_for(asyncio.wrap_future(future), max(0.1, deadline - loop.time()))
+            except BrokenProcessPool:
+                logger.error("Pool trích xuất bị hỏng, tạo lại ở lần gọi sau")
+                self._executor = None
+                raise
+            finally:
+                self.budget.release(time.perf_counter() - start)
+        finally:
+            self.pending -= 1
+
+    async def _refresh_background(self, url):
+        with with_priority(BACKGROUND):
+            return await self.refresh(url)
+
+    async def extract(self, url, timeout=None):
+        vid = video_id(url)
+        if vid:
+            cached = self.cache.get(vid)
+            if cached:
+                return cached
+        # Nhiều guild cùng /play một link: chỉ trích xuất một lần
+        return await self.flights.do(('extract', vid or url), lambda: self.refresh(url), timeout or self.timeout)
+
+    async def refresh(self, url, timeout=None, fmt=None):
+        # Luôn trích xuất lại (bỏ qua cache) rồi ghi kết quả vào cache
+        logger.info(f"Đang trích xuất audio từ: {url}")
+        with metrics.timer('dj_extract_seconds'):
+            data = await self._submit(_extract, url, fmt, timeout=timeout)
+        if not data or not data.get('url'):
+            raise ValueError("Không lấy được stream URL")
+        if fmt is None:
+            self.cache.put(data)  # định dạng dự phòng của failover chỉ dùng cho lần phát này, không ghi đè bestaudio
+        return data
+
+    async def search(self, query, limit=1, timeout=None):
+        key = ('search', normalize_query(query), limit)
+        return await self.flights.do(key, lambda: self._submit(_search_pytube, query, limit), timeout or self.timeout)
+
+    async def ytsearch(self, query, limit=5, timeout=None):
+        key = ('ytsearch', normalize_query(query), limit)
+        return await self.flights.do(key, lambda: self._submit(_search_ytdl, query, limit), timeout or self.timeout)
+
+    async def playlist(self, url, start, end, timeout=None):
+        return await self._submit(_extract_playlist, url, start, end, timeout=timeout)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+resolver = Resolver()
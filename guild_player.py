@@ -0,0 +1,604 @@
+# guild_player.py - DJ_TET actor theo guild: mọi thay đổi queue / trạng thái phát đi qua một inbox
+import asyncio
+import logging
+import time
+
+from admission import PLAY_NOW, with_priority
+from metrics import metrics
+from mixer import CROSSFADE_SECONDS, HANDOFF_LEAD, Mixer
+from player import FAILOVER_FORMATS, FAILOVER_LEAD, create_player, reopen
+from playlist import cancel_import
+from prefetch import Prefetcher
+from search import searcher
+from state_store import state_store
+from track_queue import TrackQueue
+
+logger = logging.getLogger("DJ_TET")
+
+IDLE = 'idle'
+RESOLVING = 'resolving'
+PLAYING = 'playing'
+PAUSED = 'paused'
+RADIO = 'radio'
+
+
+class GuildPlayer:
+    def __init__(self, registry, guild_id):
+        self.registry = registry
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
+        self.repeat_mode = 0  # 0: off, 1: song, 2: queue
+        self.current = None  # {'track', 'url', 'title', 'duration', 'player', 'message'}
+        self.settings = {}  # cài đặt theo guild được lưu cùng queue (vd. auto now playing)
+        self.pending_resume = None  # (channel_id, track, offset) nạp từ state DB
+        self.station = None  # radio.Station đang nghe (state RADIO)
+        self.state = IDLE
+        self.prefetch = Prefetcher(guild_id)
+        self.mixer = None  # mixer.Mixer của lượt phát hiện tại (nguồn của vc)
+        self.generation = 0  # tăng mỗi lần đổi bài; callback của bài cũ bị bỏ qua
+        self.skipping = False  # /skip bỏ qua repeat bài hiện tại
+        self.inbox = asyncio.Queue()
+        self._resolving = None
+        self._resolve_started = 0
+        self._seeking = None
+        self._failing_over = None  # Tracked đang được đổi nguồn (chỉ một failover mỗi source)
+        self._expiry_timer = None
+        self._handoff_timer = None
+        self._task = None
+        self._loop = None
+
+    @property
+    def voice_client(self):
+        guild = self.registry.bot.get_guild(self.guild_id)
+        return guild.voice_client if guild else None
+
+    # === GỬI LỆNH ===
+    def _post(self, name, *args, future=None):
+        self.inbox.put_nowait((name, args, future))
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    def _call(self, name, *args):
+        future = asyncio.get_running_loop().create_future()
+        self._post(name, *args, future=future)
+        return future
+
+    def _post_threadsafe(self, name, *args):
+        # Dùng cho callback `after` của vc.play (chạy trên thread audio)
+        self._loop.call_soon_threadsafe(self._post, name, *args)
+
+    async def _run(self):
+        while not self.inbox.empty():
+            name, args, future = self.inbox.get_nowait()
+            try:
+                result = await getattr(self, f"_on_{name}")(*args)
+                if future is not None and not future.done():
+                    future.set_result(result)
+                state_store.mark(self)
+            except Exception as e:
+                logger.error(f"Lỗi xử lý lệnh {name} (guild {self.guild_id}): {e}")
+                if future is not None and not future.done():
+                    future.set_exception(e)
+
+    # === API CHO LỆNH SLASH ===
+    def join(self, channel):
+        return self._call('join', channel)
+
+    def enqueue(self, tracks):
+        return self._call('enqueue', list(tracks))
+
+    def skip(self):
+        return self._call('skip')
+
+    def stop(self):
+        return self._call('stop')
+
+    def leave(self):
+        return self._call('leave')
+
+    def clear(self):
+        return self._call('clear')
+
+    def shuffle(self):
+        return self._call('shuffle')
+
+    def remove(self, index):
+        return self._call('remove', index)
+
+    def move(self, src, dst):
+        return self._call('move', src, dst)
+
+    def set_repeat(self, mode):
+        return self._call('repeat', mode)
+
+    def set_setting(self, key, value):
+        return self._call('setting', key, value)
+
+    def pause(self):
+        return self._call('pause')
+
+    def resume(self):
+        return self._call('resume')
+
+    def resume_session(self):
+        return self._call('resume_session')
+
+    def seek(self, seconds):
+        return self._call('seek', seconds)
+
+    def listen(self, station):
+        return self._call('listen', station)
+
+    def position(self):
+        # Tính từ số frame đã gửi (player.Tracked), không phụ thuộc đồng hồ
+        return self.current['player'].position if self.current else 0
+
+    # === XỬ LÝ (chỉ chạy trong actor) ===
+    async def _on_join(self, channel):
+        vc = self.voice_client
+        if vc and vc.is_connected():
+            return vc
+        vc = await channel.connect()
+        logger.info(f"Đã vào voice: {vc.channel.name}")
+        return vc
+
+    async def _on_enqueue(self, tracks):
+        # Trả về True nếu lệnh này làm bot bắt đầu phát
+        self.queue.extend(tracks)
+        if self.state == RADIO:
+            self._leave_radio()
+        if self.state == IDLE:
+            self._start_next()
+            return True
+        self._queue_changed()
+        return False
+
+    async def _on_skip(self):
+        if self.state == PLAYING and self.mixer and self.mixer.advance():
+            self.skipping = True  # bài kế đã mở sẵn trong mixer: fade ngắn sang bài kế, không dừng AudioPlayer
+            return True
+        if self.state in (PLAYING, PAUSED):
+            self.skipping = True
+            self.voice_client.stop()  # callback after -> track_end
+            return True
+        if self.state == RESOLVING:
+            self._cancel_resolving()
+            self._start_next()
+            return True
+        return False
+
+    async def _on_stop(self):
+        cancel_import(self.guild_id)
+        self.queue.clear()
+        await self._disconnect()
+
+    async def _on_leave(self):
+        # Reaper: rời kênh trống / rảnh nhưng giữ queue, bài đang phát xếp lại đầu queue
+        if self.current:
+            self.queue.appendleft(self.current['track'])
+        await self._disconnect()
+
+    async def _on_clear(self):
+        cancel_import(self.guild_id)
+        self.queue.clear()
+        self._queue_changed()
+
+    async def _on_shuffle(self):
+        if len(self.queue) < 2:
+            return False
+        self.queue.shuffle()
+        self._queue_changed()
+        return True
+
+    async def _on_remove(self, index):
+        if not 0 <= index < len(self.queue):
+            return None
+        removed = self.queue.pop(index)
+        self._queue_changed()
+        return removed
+
+    async def _on_move(self, src, dst):
+        if not (0 <= src < len(self.queue) and 0 <= dst < len(self.queue)):
+            return None
+        track = self.queue.move(src, dst)
+        self._queue_changed()
+        return track
+
+    async def _on_repeat(self, mode):
+        self.repeat_mode = mode
+        if mode == 1 and self.mixer:
+            self.mixer.retract()  # lặp bài: không chuyển sang bài kế đã giao
+
+    async def _on_setting(self, key, value):
+        if value is None:
+            self.settings.pop(key, None)
+        else:
+            self.settings[key] = value
+
+    async def _on_pause(self):
+        if self.state != PLAYING:
+            return False
+        self.voice_client.pause()
+        self.state = PAUSED
+        self._disarm_timers()  # hẹn giờ tính theo vị trí phát: đặt lại khi resume
+        return True
+
+    async def _on_resume(self):
+        if self.state != PAUSED:
+            return False
+        self.voice_client.resume()
+        self.state = PLAYING
+        self._arm_expiry(self.generation)
+        self._arm_handoff(self.generation)
+        return True
+
+    async def _on_resume_session(self):
+        # Sau khi bot khởi động lại: vào lại voice cũ, phát tiếp bài đang dở từ vị trí đã lưu
+        channel_id, track, offset = self.pending_resume
+        channel = self.registry.bot.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            state_store.requeue(self)
+            return False
+        try:
+            await self._on_join(channel)
+        except Exception:
+            state_store.requeue(self)  # không vào được voice (quyền, kênh đầy, timeout): giữ bài dở trong queue
+            raise
+        self.pending_resume = None
+        if track is not None:
+            self.queue.appendleft(track)
+        if self.state == IDLE:
+            logger.info(f"Khôi phục guild {self.guild_id}: {len(self.queue)} bài, tiếp tục từ {offset:.0f}s")
+            self._start_next(offset if track is not None else 0)
+        return True
+
+    async def _on_listen(self, station):
+        # Chuyển sang nghe radio: queue giữ nguyên, bài đang phát (nếu có) dừng lại
+        listener = await station.subscribe()
+        vc = self.voice_client
+        if not vc or not vc.is_connected():
+            listener.cleanup()
+            return False
+        self._cancel_resolving()
+        self.generation += 1
+        generation = self.generation
+        self.mixer = None
+        vc.stop()
+        self.current = None
+        self.station = station
+        self.state = RADIO
+        vc.play(listener, after=lambda e: self._post_threadsafe('radio_end', generation, e))
+        return True
+
+    async def _on_radio_end(self, generation, error):
+        if generation != self.generation:
+            return
+        if error:
+            logger.error(f"Radio error: {error}")
+        self.station = None
+        self._set_idle()
+
+    async def _on_seek(self, seconds):
+        # Trả về vị trí mới, hoặc None nếu không có bài để tua
+        if self.state not in (PLAYING, PAUSED):
+            return None
+        duration = self.current['duration']
+        target = max(0, seconds)
+        if duration:
+            target = min(target, max(0, duration - 1))
+        if self._seeking is not None:
+            self._seeking.cancel()
+        # Bài cũ vẫn phát cho tới khi source mới sẵn sàng; stream URL lấy lại từ track cache, không trích xuất lại
+        self._seeking = asyncio.create_task(self._seek(self.generation, self.current['track'], target))
+        return target
+
+    async def _seek(self, generation, track, target):
+        try:
+            with with_priority(PLAY_NOW):
+                player = await create_player(track.url, target)
+        except Exception as e:
+            logger.error(f"Lỗi tua bài: {e}")
+            return
+        self._post('seeked', generation, player)
+
+    async def _on_seeked(self, generation, player):
+        self._seeking = None
+        vc = self.voice_client
+        if generation != self.generation or self.state not in (PLAYING, PAUSED) or not vc or not self.mixer:
+            player.cleanup()
+            return
+        if player.is_opus() == self.mixer.current.is_opus():
+            self.mixer.replace(player)  # thread audio đổi source ở frame kế và dọn source cũ
+        else:
+            # Cache audio (Opus) trượt sau khi có gain mới -> source PCM: vc chưa có encoder, phát lại bằng vc.play mới
+            self.generation += 1
+            generation = self.generation
+            self.mixer = None  # after của mixer cũ bị bỏ qua
+            vc.stop()
+            self._play(vc, player)
+            if self.state == PAUSED:
+                vc.pause()
+        self.current['player'] = player
+        self._watch(generation, player)
+        self.prefetch.track_started((player.duration or 0) - player.start)  # hẹn lại giờ mở sẵn theo vị trí mới
+        self.prefetch.schedule(self.queue)
+
+    async def _on_resolved(self, generation, track, player, start):
+        if generation != self.generation:
+            if player is not None:
+                player.cleanup()  # bài đã bị skip/stop trong lúc resolve
+            return
+        self._resolving = None
+        vc = self.voice_client
+        if player is None:
+            self._start_next()  # bài lỗi, chuyển bài kế
+            return
+        if not vc or not vc.is_connected():
+            logger.warning("Voice client không kết nối, bỏ qua bài này")
+            player.cleanup()
+            self._set_idle()
+            return
+        player.started = time.perf_counter()
+        metrics.observe('dj_track_start_seconds', player.started - self._resolve_started)
+        self._play(vc, player)
+        self.state = PLAYING
+        self._now_playing(generation, track, player)
+
+    def _play(self, vc, player):
+        mixer = self.mixer = Mixer(player, lambda track, source: self._post_threadsafe('mixed', mixer, track, source))
+        vc.play(mixer, after=lambda e: self._post_threadsafe('track_end', mixer, e))
+
+    async def _on_mixed(self, mixer, track, player):
+        # Mixer đã chuyển sang bài kế ngay trên thread audio (crossfade / nối liền)
+        if mixer is not self.mixer:
+            return
+        finished = self.current['track']
+        if self.repeat_mode == 2:
+            self.queue.append(finished)
+        if self.queue and self.queue[0] is track:
+            self.queue.popleft()
+        self.generation += 1
+        metrics.inc('dj_track_transitions_total', kind='skip' if self.skipping else 'mixed')
+        logger.info(f"Phát tiếp (nối bài): {track.title}")
+        self._now_playing(self.generation, track, player)
+
+    def _now_playing(self, generation, track, player):
+        self.current = {
+            'track': track,
+            'url': track.url,
+            'title': track.title,
+            'duration': player.duration,
+            'player': player,
+            'message': None,
+        }
+        self.skipping = False
+        self._watch(generation, player)
+        self.prefetch.track_started((player.duration or 0) - player.start)
+        searcher.remember(track)
+        self.prefetch.schedule(self.queue)
+        if self.registry.on_track_start:
+            asyncio.create_task(self.registry.on_track_start(self))
+
+    def _queue_changed(self):
+        self.prefetch.schedule(self.queue)
+        if self.mixer:
+            self.mixer.retract(self.queue[0] if self.queue else None)
+
+    def _arm_handoff(self, generation):
+        # Giao bài kế (FFmpeg đã mở sẵn) cho mixer trước lúc crossfade; chưa mở sẵn thì hết bài chuyển như cũ
+        if self._handoff_timer is not None:
+            self._handoff_timer.cancel()
+            self._handoff_timer = None
+        player = self.current['player']
+        if not self.current['duration']:
+            return
+        delay = self.current['duration'] - player.position - CROSSFADE_SECONDS - HANDOFF_LEAD
+        self._handoff_timer = asyncio.get_running_loop().call_later(
+            max(0, delay), self._post, 'handoff', generation, player)
+
+    async def _on_handoff(self, generation, player):
+        self._handoff_timer = None
+        if generation != self.generation or self.state != PLAYING or self.current['player'] is not player:
+            return
+        if not self.mixer or not self.queue or self.repeat_mode == 1:
+            return
+        track = self.queue[0]
+        source = self.prefetch.peek(track.url)
+        # vc.play chỉ tạo encoder khi source đầu tiên là PCM: khác loại với bài đang phát thì để hết bài
+        # rồi vc.play lại như cũ (bài mở sẵn vẫn được _resolve dùng)
+        if source is None or source.is_opus() != self.mixer.current.is_opus():
+            return
+        self.mixer.queue_next(track, self.prefetch.take(track.url))
+
+    async def _on_track_end(self, mixer, error):
+        if mixer is not self.mixer:
+            return
+        self.mixer = None
+        if error:
+            logger.error(f"Player error: {error}")
+            metrics.inc('dj_track_errors_total', stage='play')
+            self._start_next()  # bỏ bài lỗi, queue vẫn chạy tiếp
+            return
+        finished = self.current['track']
+        if self.repeat_mode == 1 and not self.skipping:  # repeat song
+            self.queue.appendleft(finished)
+        elif self.repeat_mode == 2:  # repeat queue
+            self.queue.append(finished)
+        self._start_next()
+
+    # === FAILOVER (stream URL hết hạn / lỗi giữa bài) ===
+    async def _on_failover(self, generation, player, reason):
+        if generation != self.generation or not self.current or self.current['player'] is not player:
+            return
+        if self._failing_over is player:
+            return
+        self._failing_over = player
+        asyncio.create_task(self._fail_over(generation, self.current['track'], player, reason))
+
+    async def _fail_over(self, generation, track, player, reason):
+        # Lấy stream URL mới rồi ghép vào đúng frame đang phát; vẫn lỗi thì thử các định dạng dự phòng
+        start = time.perf_counter()
+        ok = False
+        with with_priority(PLAY_NOW):
+            for fmt in (None, *FAILOVER_FORMATS):
+                position = player.position
+                try:
+                    source = await reopen(track.url, position, fmt)
+                except Exception as e:
+                    logger.warning(f"Failover {track.title} ({fmt or 'bestaudio'}) lỗi: {e}")
+                    continue
+                if source.is_opus() != player.is_opus():
+                    source.cleanup()  # AudioPlayer có thể chưa có encoder cho PCM (xem _on_handoff)
+                    continue
+                if await asyncio.to_thread(player.splice, source, position):
+                    ok = True
+                    break
+                source.cleanup()
+        metrics.inc('dj_failover_total', reason=reason, result='ok' if ok else 'failed')
+        metrics.observe('dj_failover_seconds', time.perf_counter() - start)
+        self._post('failed_over', generation, player, reason, ok)
+
+    async def _on_failed_over(self, generation, player, reason, ok):
+        if self._failing_over is player:
+            self._failing_over = None
+        if generation != self.generation or not self.current or self.current['player'] is not player:
+            player.drop_incoming()  # bài đã đổi trong lúc failover
+            return
+        if ok:
+            logger.info(f"Đổi nguồn ({reason}) tại {player.position:.0f}s: {self.current['title']}")
+            self._arm_expiry(generation)
+        elif reason == 'stall':
+            logger.error(f"Không khôi phục được stream, bỏ qua: {self.current['title']}")
+            player.abandoned = True  # thread audio dừng phát lặng -> track_end -> bài kế
+
+    def _watch(self, generation, player):
+        player.on_stall = lambda: self._post_threadsafe('failover', generation, player, 'stall')
+        self._arm_expiry(generation)
+        self._arm_handoff(generation)
+
+    def _arm_expiry(self, generation):
+        # Bài dài / vừa resume sau pause lâu: đổi nguồn trước khi URL hết hạn, không có khoảng lặng
+        self._disarm_expiry()
+        player = self.current['player']
+        expires_at = getattr(player, 'expires_at', None)
+        if not expires_at:
+            return  # file trong cache audio, hoặc URL không ghi hạn
+        delay = expires_at - FAILOVER_LEAD - time.time()
+        duration = self.current['duration']
+        if duration and delay > duration - player.position:
+            return  # hết bài trước khi hết hạn
+        self._expiry_timer = asyncio.get_running_loop().call_later(
+            max(0, delay), self._post, 'failover', generation, player, 'expiry')
+
+    def _disarm_expiry(self):
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+
+    def _disarm_timers(self):
+        self._disarm_expiry()
+        if self._handoff_timer is not None:
+            self._handoff_timer.cancel()
+            self._handoff_timer = None
+
+    # === NỘI BỘ ===
+    def _start_next(self, start=0):
+        self._disarm_timers()
+        if not self.queue:
+            self._set_idle()
+            return
+        vc = self.voice_client
+        if not vc or not vc.is_connected():
+            logger.warning("Voice client không kết nối, bỏ qua bài này")
+            self._set_idle()
+            return
+        track = self.queue.popleft()
+        logger.info(f"Phát tiếp: {track.title}")
+        self.generation += 1
+        self.current = None
+        self.state = RESOLVING
+        self._resolve_started = time.perf_counter()
+        self._resolving = asyncio.create_task(self._resolve(self.generation, track, start))
+
+    async def _resolve(self, generation, track, start):
+        try:
+            # Bài mở sẵn luôn phát từ đầu; phát tiếp giữa chừng thì tạo player mới với -ss
+            player = None if start else self.prefetch.take(track.url)
+            metrics.inc('dj_track_resolves_total', source='prefetch' if player else 'create')
+            with with_priority(PLAY_NOW):  # guild đang im lặng chờ bài này: vượt lên trước prefetch / lệnh khác
+                player = player or await create_player(track.url, start)
+        except Exception as e:
+            logger.error(f"Lỗi play_next: {e}")
+            metrics.inc('dj_track_errors_total', stage='resolve')
+            player = None
+        self._post('resolved', generation, track, player, start)
+
+    async def _disconnect(self):
+        self.prefetch.close()
+        self._cancel_resolving()
+        self.generation += 1
+        self.mixer = None
+        self.station = None
+        vc = self.voice_client
+        if vc:
+            vc.stop()
+            await vc.disconnect()
+        self._set_idle()
+
+    def _leave_radio(self):
+        self.generation += 1
+        vc = self.voice_client
+        if vc:
+            vc.stop()  # AudioPlayer gọi listener.cleanup() -> bỏ đăng ký khỏi station
+        self.station = None
+        self.state = IDLE
+
+    def _cancel_resolving(self):
+        if self._seeking is not None:
+            self._seeking.cancel()
+            self._seeking = None
+        if self._resolving is not None:
+            self._resolving.cancel()
+            self._resolving = None
+            self.generation += 1
+
+    def _set_idle(self):
+        self._disarm_timers()
+        self.mixer = None
+        was_active = self.state != IDLE or self.current is not None
+        self.state = IDLE
+        self.current = None
+        if was_active and self.registry.on_idle:
+            self.registry.on_idle(self)
+
+
+class PlayerRegistry:
+    def __init__(self, bot, on_track_start=None, on_idle=None):
+        self.bot = bot
+        self.on_track_start = on_track_start  # async (GuildPlayer) -> None
+        self.on_idle = on_idle  # (GuildPlayer) -> None
+        self.players = {}
+
+    def get(self, guild_id):
+        if guild_id not in self.players:
+            gp = GuildPlayer(self, guild_id)
+            gp.pending_resume = state_store.restore(gp)  # nạp lười: chỉ parse khi guild được dùng
+            self.players[guild_id] = gp
+        return self.players[guild_id]
+
+    def peek(self, guild_id):
+        return self.players.get(guild_id)
+
+    def evict(self, guild_id):
+        # Bỏ GuildPlayer rảnh khỏi RAM; state (queue, cài đặt) nằm trong DB, get() sau này nạp lại
+        gp = self.players.get(guild_id)
+        if gp is None or gp.state != IDLE or not gp.inbox.empty() or gp.voice_client is not None:
+            return False
+        if gp._task is not None and not gp._task.done():
+            return False
+        if not state_store.evict(gp):
+            return False
+        gp.prefetch.close()
+        del self.players[guild_id]
+        return True
@@ -0,0 +1,285 @@
+# launcher.py - DJ_TET chạy bot thành nhiều worker process (mỗi worker giữ một nhóm shard), tự khởi động lại worker chết
+import asyncio
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+import discord
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === LOGGING ===
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+BOT_SCRIPT = os.getenv('BOT_SCRIPT', 'main_v2.py')
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))  # 0 = dùng số shard Discord khuyến nghị
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))  # 0 = một worker mỗi CPU
+SHARD_PIN_CPUS = os.getenv('SHARD_PIN_CPUS', '0') == '1'  # gắn mỗi worker (và FFmpeg con của nó) vào một CPU
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9110'))  # worker i dùng cổng 9110 + i
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # /metrics và /status gộp của mọi worker
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', 'dj_tet_shared.db')
+IDENTIFY_INTERVAL = 5.0  # Discord cho mỗi bucket identify một shard / 5 giây
+RESTART_MIN_DELAY = 1.0
+RESTART_MAX_DELAY = 60.0
+STABLE_UPTIME = 60.0  # chạy đủ lâu thì reset backoff
+STOP_TIMEOUT = 15.0
+
+# Worker chạy trong nhóm process riêng: Ctrl+C chỉ tới supervisor, supervisor tự dừng từng worker
+if os.name == 'nt':
+    # Windows không có setsid và không gửi được SIGINT cho process khác: dùng CTRL_BREAK_EVENT cho nhóm process
+    WORKER_SPAWN = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    WORKER_STOP_SIGNAL = signal.CTRL_BREAK_EVENT
+else:
+    WORKER_SPAWN = {'start_new_session': True}
+    WORKER_STOP_SIGNAL = signal.SIGINT  # bot.run đóng kết nối và voice client gọn gàng
+
+
+def split_shards(shard_count, workers):
+    # Chia liên tiếp: worker 0 giữ shard 0..k-1 (và sync command tree), worker 1 giữ k..2k-1, ...
+    size, extra = divmod(shard_count, workers)
+    groups, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+def label_metrics(text, worker):
+    # Gắn nhãn worker="i" vào từng dòng của /metrics worker
+    lines = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        if '{' in name:
+            name = name.replace('{', f'{{worker="{worker}",', 1)
+        else:
+            name = f'{name}{{worker="{worker}"}}'
+        lines.append(f"{name} {value}")
+    return lines
+
+
+def sum_metric(text, name):
+    total = 0.0
+    for line in text.splitlines():
+        if line.startswith((f"{name} ", f"{name}{{")):
+            try:
+                total += float(line.rpartition(' ')[2])
+            except ValueError:
+                pass
+    return total
+
+
+class Worker:
+    def __init__(self, index, shard_ids, shard_count, cpu=None):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.cpu = cpu
+        self.metrics_port = WORKER_METRICS_PORT + index
+        self.proc = None
+        self.started_at = None
+        self.restarts = 0
+        self.last_exit = None
+        self.delay = RESTART_MIN_DELAY
+
+    @property
+    def up(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    def env(self):
+        env = dict(os.environ)
+        env['SHARD_IDS'] = ','.join(map(str, self.shard_ids))
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['METRICS_PORT'] = str(self.metrics_port)
+        env['METRICS_HOST'] = '127.0.0.1'
+        env['SHARED_CACHE_PATH'] = SHARED_CACHE_PATH
+        if SHARED_CACHE_PATH:
+            env['TRACK_CACHE_PATH'] = ''  # metadata đã nằm trong shared cache, không để các worker ghi đè file JSON
+        if env.get('AUDIO_CACHE_DIR'):
+            # Mỗi worker tự quản lý (và xoá) file của mình: không xoá file worker khác đang đọc
+            env['AUDIO_CACHE_DIR'] = os.path.join(env['AUDIO_CACHE_DIR'], f"worker{self.index}")
+        return env
+
+    async def _pipe_output(self, stream):
+        prefix = f"[w{self.index}] ".encode()
+        while True:
+            line = await stream.readline()
+            if not line:
+                return
+            sys.stdout.buffer.write(prefix + line)
+            sys.stdout.flush()
+
+    async def run_once(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, env=self.env(),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, **WORKER_SPAWN)
+        self.started_at = time.time()
+        if self.cpu is not None:
+            try:
+                os.sched_setaffinity(self.proc.pid, {self.cpu})
+            except (AttributeError, OSError) as e:
+                logger.warning(f"Worker {self.index}: không gắn được CPU {self.cpu}: {e}")
+        logger.info(f"Worker {self.index} (pid {self.proc.pid}) chạy shard {self.shard_ids}")
+        await self._pipe_output(self.proc.stdout)
+        self.last_exit = await self.proc.wait()
+        return time.time() - self.started_at
+
+    async def stop(self):
+        if not self.up:
+            return
+        self.proc.send_signal(WORKER_STOP_SIGNAL)
+        try:
+            await asyncio.wait_for(self.proc.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Worker {self.index} không dừng sau {STOP_TIMEOUT:.0f}s, kill")
+            self.proc.kill()
+            await self.proc.wait()
+
+    def status(self):
+        return {
+            'worker': self.index,
+            'shards': self.shard_ids,
+            'pid': self.proc.pid if self.up else None,
+            'up': self.up,
+            'uptime': round(time.time() - self.started_at, 1) if self.up else 0,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+        }
+
+
+class Supervisor:
+    def __init__(self):
+        self.workers = []
+        self.stopping = False
+        self._tasks = []
+        self._session = None
+
+    async def _recommended_shards(self):
+        http = discord.http.HTTPClient(asyncio.get_running_loop())
+        try:
+            await http.static_login(os.getenv('DISCORD_TOKEN'))
+            shards, _, limit = await http.get_bot_gateway()
+            return shards, limit.get('max_concurrency', 1)
+        finally:
+            await http.close()
+
+    async def _supervise(self, worker, delay):
+        await asyncio.sleep(delay)
+        while not self.stopping:
+            uptime = await worker.run_once()
+            if self.stopping:
+                return
+            worker.restarts += 1
+            # Crash liên tục thì chờ lâu dần, tránh identify dồn dập bị Discord chặn
+            worker.delay = RESTART_MIN_DELAY if uptime > STABLE_UPTIME else min(worker.delay * 2, RESTART_MAX_DELAY)
+            logger.warning(f"Worker {worker.index} thoát (code {worker.last_exit}) sau {uptime:.0f}s, "
+                           f"chạy lại sau {worker.delay:.0f}s")
+            await asyncio.sleep(worker.delay)
+
+    # === METRICS / STATUS GỘP ===
+    async def _scrape(self, worker):
+        if not worker.up:
+            return ''
+        try:
+            async with self._session.get(f"http://127.0.0.1:{worker.metrics_port}/metrics") as resp:
+                return await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return ''
+
+    async def _scrape_all(self):
+        return await asyncio.gather(*(self._scrape(w) for w in self.workers))
+
+    async def _handle_metrics(self, request):
+        lines = []
+        for worker, text in zip(self.workers, await self._scrape_all()):
+            labels = f'{{worker="{worker.index}"}}'
+            lines.append(f"dj_worker_up{labels} {int(worker.up)}")
+            lines.append(f"dj_worker_restarts_total{labels} {worker.restarts}")
+            lines.append(f"dj_worker_shards{labels} {len(worker.shard_ids)}")
+            lines += label_metrics(text, worker.index)
+        return web.Response(text='\n'.join(lines) + '\n', content_type='text/plain', charset='utf-8')
+
+    async def _handle_status(self, request):
+        workers = []
+        for worker, text in zip(self.workers, await self._scrape_all()):
+            status = worker.status()
+            status['guilds'] = int(sum_metric(text, 'dj_guilds'))
+            status['players'] = int(sum_metric(text, 'dj_players'))
+            status['queue_tracks'] = int(sum_metric(text, 'dj_queue_tracks'))
+            workers.append(status)
+        total = {
+            'shard_count': self.workers[0].shard_count if self.workers else 0,
+            'workers_up': sum(1 for w in workers if w['up']),
+            'guilds': sum(w['guilds'] for w in workers),
+            'players': sum(w['players'] for w in workers),
+            'restarts': sum(w['restarts'] for w in workers),
+        }
+        return web.Response(text=json.dumps({'total': total, 'workers': workers}, indent=2),
+                            content_type='application/json')
+
+    async def _serve(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2))
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        app.router.add_get('/status', self._handle_status)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        logger.info(f"Supervisor: http://{METRICS_HOST}:{METRICS_PORT}/status")
+        return runner
+
+    # === CHẠY ===
+    async def run(self):
+        shard_count, concurrency = SHARD_COUNT, 1
+        if not shard_count:
+            shard_count, concurrency = await self._recommended_shards()
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+        workers = min(SHARD_WORKERS or len(cpus), shard_count)
+        for i, shard_ids in enumerate(split_shards(shard_count, workers)):
+            self.workers.append(Worker(i, shard_ids, shard_count, cpus[i % len(cpus)] if SHARD_PIN_CPUS else None))
+        logger.info(f"DJ_TET: {shard_count} shard trên {workers} worker")
+
+        runner = await self._serve() if METRICS_PORT else None
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, done.set)
+            except (AttributeError, NotImplementedError, RuntimeError):
+                pass
+        # Worker sau khởi động khi worker trước identify xong các shard của nó
+        delay = 0.0
+        for worker in self.workers:
+            self._tasks.append(asyncio.create_task(self._supervise(worker, delay)))
+            delay += len(worker.shard_ids) * IDENTIFY_INTERVAL / concurrency
+        try:
+            await done.wait()
+        finally:
+            self.stopping = True
+            logger.info("Đang dừng các worker...")
+            await asyncio.gather(*(w.stop() for w in self.workers))
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            if runner is not None:
+                await self._session.close()
+                await runner.cleanup()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(Supervisor().run())
+    except KeyboardInterrupt:
+        pass
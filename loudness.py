@@ -0,0 +1,138 @@
+# loudness.py - DJ_TET đo loudness (EBU R128) một lần cho mỗi bài, lưu gain theo video ID để chuẩn hoá âm lượng
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+LOUDNESS_DB_PATH = os.getenv('LOUDNESS_DB_PATH', 'dj_tet_loudness.db')  # để trống = tắt chuẩn hoá
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', '-16'))  # LUFS
+LOUDNESS_MAX_BOOST = float(os.getenv('LOUDNESS_MAX_BOOST', '6'))  # dB, bài quá nhỏ không kéo lên quá mức này
+LOUDNESS_MAX_CUT = float(os.getenv('LOUDNESS_MAX_CUT', '12'))
+LOUDNESS_PEAK_CEILING = -1.0  # dBFS: không tăng gain tới mức làm vỡ tiếng
+LOUDNESS_WORKERS = int(os.getenv('LOUDNESS_WORKERS', '1'))  # số FFmpeg đo cùng lúc
+LOUDNESS_MAX_PENDING = int(os.getenv('LOUDNESS_MAX_PENDING', '200'))
+LOUDNESS_MAX_SECONDS = int(os.getenv('LOUDNESS_MAX_SECONDS', '600'))  # chỉ đo 10 phút đầu
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS gains (id TEXT PRIMARY KEY, gain REAL, loudness REAL) WITHOUT ROWID"
+
+INTEGRATED_RE = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+PEAK_RE = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+
+
+def gain_for(loudness, peak=None):
+    gain = max(-LOUDNESS_MAX_CUT, min(LOUDNESS_MAX_BOOST, LOUDNESS_TARGET - loudness))
+    if peak is not None:
+        gain = min(gain, LOUDNESS_PEAK_CEILING - peak)
+    return round(gain, 1)
+
+
+def parse_ebur128(output):
+    # Phần tổng kết ebur128 nằm cuối stderr: "I: -13.2 LUFS" ... "Peak: -0.4 dBFS"
+    integrated = INTEGRATED_RE.findall(output)
+    if not integrated or integrated[-1] == '-inf':
+        return None, None
+    peak = PEAK_RE.findall(output)
+    return float(integrated[-1]), float(peak[-1]) if peak and peak[-1] != '-inf' else None
+
+
+class LoudnessTable:
+    # Tra gain theo khoá chính ngay trên event loop (mmap, không giữ bảng trong RAM); đo và ghi chạy nền
+    def __init__(self, path=LOUDNESS_DB_PATH):
+        self.path = path
+        self.pending = set()  # video_id đang chờ / đang đo
+        self.failed = set()  # đo lỗi (live, link chết): không thử lại trong process này
+        self.analyzed = 0
+        self._queue = None
+        self._workers = []
+        self._db = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('PRAGMA mmap_size=16777216')
+            self._db.execute(SCHEMA)
+        return self._db
+
+    def gain(self, video_id):
+        # dB cần cộng thêm, None nếu chưa đo
+        if not self.enabled or not video_id:
+            return None
+        try:
+            row = self._connect().execute('SELECT gain FROM gains WHERE id = ?', (video_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Không đọc được bảng loudness: {e}")
+            return None
+        return row[0] if row else None
+
+    def _store(self, video_id, gain, loudness):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO gains VALUES (?, ?, ?)', (video_id, gain, loudness))
+
+    # === ĐO ===
+    def schedule(self, video_id, source, executable, offset=0.0, duration=0):
+        # source: stream URL, hoặc file trong cache audio (offset = gain dB đã áp khi encode file đó)
+        if not self.enabled or not video_id or not duration:
+            return  # live stream không có loudness tích phân
+        if video_id in self.pending or video_id in self.failed or len(self.pending) >= LOUDNESS_MAX_PENDING:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker(executable)) for _ in range(LOUDNESS_WORKERS)]
+        self.pending.add(video_id)
+        self._queue.put_nowait((video_id, source, offset))
+
+    async def _worker(self, executable):
+        while True:
+            video_id, source, offset = await self._queue.get()
+            start = time.perf_counter()
+            try:
+                loudness, peak = await self._measure(executable, source)
+                if loudness is None:
+                    raise ValueError("không đo được loudness")
+                loudness -= offset
+                peak = peak - offset if peak is not None else None
+                gain = gain_for(loudness, peak)
+                await asyncio.to_thread(self._store, video_id, gain, round(loudness, 1))
+                self.analyzed += 1
+                metrics.inc('dj_loudness_analyses_total', result='ok')
+                logger.info(f"Loudness {video_id}: {loudness:.1f} LUFS -> gain {gain:+.1f} dB")
+            except Exception as e:
+                self.failed.add(video_id)
+                metrics.inc('dj_loudness_analyses_total', result='error')
+                logger.warning(f"Đo loudness thất bại {video_id}: {e}")
+            finally:
+                self.pending.discard(video_id)
+                metrics.observe('dj_loudness_analysis_seconds', time.perf_counter() - start)
+
+    async def _measure(self, executable, source):
+        # Chỉ decode + đo, không encode/ghi gì: -f null
+        network = ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5'] \
+            if '://' in source else []
+        proc = await asyncio.create_subprocess_exec(
+            executable, '-nostdin', '-hide_banner', '-nostats', *network,
+            '-t', str(LOUDNESS_MAX_SECONDS), '-i', source, '-vn',
+            '-filter:a', 'ebur128=peak=sample:framelog=verbose', '-f', 'null', '-',
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.decode(errors='ignore')[-200:])
+        return parse_ebur128(stderr.decode(errors='ignore')[-4000:])
+
+    def stats(self):
+        return {'analyzed': self.analyzed, 'pending': len(self.pending), 'failed': len(self.failed)}
+
+
+loudness_table = LoudnessTable()
@@ -1,19 +1,33 @@
 # main_v2.py - DJ_TET Version 2 (Thêm Now Playing Display)
+from startup import startup  # import đầu tiên: đo thời gian import các module nặng
 import discord
 from discord import app_commands, Embed
-from discord.ext import commands
 from discord.ui import View, Button
-import yt_dlp
 import asyncio
 import re
 import logging
-import random
-import time
 import os
 from dotenv import load_dotenv
-from pytube import Search
+from admission import admission, Overloaded
+from extractor import resolver, ResolverBusy, time_left
+from audio_cache import audio_cache
+from search import searcher
+from search_index import search_index
+from state_store import state_store
+from radio import stations
+from metrics import metrics
+from monitoring import monitor
+from reaper import reaper
+import profiler
+from guild_player import PlayerRegistry
+from sharding import create_bot, is_primary
+from track_queue import Track
+from queue_view import QueueView
+from playlist import PLAYLIST_MAX_ENTRIES, is_playlist_url, start_import
+from nowplaying import now_playing_scheduler
 
 load_dotenv()
+startup.mark('imports')
 
 # === LOGGING ===
 logging.basicConfig(level=logging.INFO)
@@ -22,31 +36,9 @@ logger = logging.getLogger("DJ_TET")
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
-bot = commands.Bot(command_prefix='!', intents=intents, description="DJ_TET – Bot nhạc Tết 2026 v2")
+bot = create_bot(command_prefix='!', intents=intents, description="DJ_TET – Bot nhạc Tết 2026 v2")
 tree = bot.tree
 
-# === YT-DLP CONFIG ===
-ytdl = yt_dlp.YoutubeDL({
-    'format': 'bestaudio/best',
-    'noplaylist': True,
-    'quiet': False,
-    'source_address': '0.0.0.0',
-    'logger': logger
-})
-
-ffmpeg_options = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn -filter:a "volume=0.5"'
-}
-
-ffmpeg_path = r"C:\Users\Admin\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0-full_build\bin\ffmpeg.exe"
-
-queue = {}
-repeat_mode = {}  # 0: off, 1: song, 2: queue
-current_song = {}  # guild_id: {'url': str, 'title': str, 'start_time': float, 'duration': int, 'message': discord.Message}
-auto_now_playing = {}  # guild_id: bool
-auto_now_playing_channel = {}  # guild_id: channel_id
-
 def is_youtube_url(url):
     return re.match(r'(https?://)?(www\.)?(youtube|youtu\.be)', url) is not None
 
@@ -61,81 +53,80 @@ def format_time(seconds):
     mins, secs = divmod(int(seconds), 60)
     return f"{mins}:{secs:02d}"
 
-class Player(discord.PCMVolumeTransformer):
-    def __init__(self, source, data):
-        super().__init__(source)
-        self.title = data.get('title', 'Unknown')
-        self.duration = data.get('duration', 0)
+def now_playing_embed(np):
+    current_time = min(np['player'].position, np['duration'] or float('inf'))
+    progress_bar = create_progress_bar(current_time, np['duration'])
+    embed = Embed(title="🎵 Now Playing", color=0x00ff00)
+    embed.add_field(name=np['title'], value=f"{progress_bar}\n{format_time(current_time)} / {format_time(np['duration'])}", inline=False)
+    embed.add_field(name="Link", value=f"[YouTube]({np['url']})", inline=False)
+    return embed
+
+def track_now_playing(guild_id, np, message):
+    # Scheduler chung sửa tin nhắn cho tới khi bài đổi hoặc tin nhắn khác thay thế
+    # np đọc trước khi gửi tin nhắn: bài đã hết / đổi trong lúc chờ Discord thì không gắn tin nhắn vào bài mới
+    gp = players.get(guild_id)
+    if gp.current is not np:
+        return
+    np['message'] = message
+    def render():
+        if gp.current is not np or np['message'] is not message:
+            return None
+        return now_playing_embed(np)
+    now_playing_scheduler.track(guild_id, message, render)
+
+async def announce_now_playing(gp):
+    # Auto now playing
+    channel_id = gp.settings.get('auto_now_playing_channel')
+    if channel_id:
+        channel = bot.get_channel(channel_id)
+        np = gp.current
+        if channel and np:
+            message = await channel.send(embed=now_playing_embed(np))
+            track_now_playing(gp.guild_id, np, message)
+
+def on_player_idle(gp):
+    # No more songs, stop now playing updates
+    now_playing_scheduler.stop(gp.guild_id)
+
+players = PlayerRegistry(bot, on_track_start=announce_now_playing, on_idle=on_player_idle)
 
-    @classmethod
-    async def create(cls, url, loop):
-        logger.info(f"Đang trích xuất audio từ: {url}")
-        try:
-            data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
-            if not data or 'url' not in data:
-                raise ValueError("Không lấy được stream URL")
-            return cls(discord.FFmpegPCMAudio(data['url'], executable=ffmpeg_path, **ffmpeg_options), data)
-        except Exception as e:
-            logger.error(f"Lỗi tạo player: {e}")
-            raise
-
-async def update_now_playing(guild_id):
-    while True:
-        if guild_id in current_song:
-            np = current_song[guild_id]
-            if 'message' in np and np['message']:
-                current_time = time.time() - np['start_time']
-                progress_bar = create_progress_bar(current_time, np['duration'])
-                embed = Embed(title="🎵 Now Playing", color=0x00ff00)
-                embed.add_field(name=np['title'], value=f"{progress_bar}\n{format_time(current_time)} / {format_time(np['duration'])}", inline=False)
-                embed.add_field(name="Link", value=f"[YouTube]({np['url']})", inline=False)
-                try:
-                    await np['message'].edit(embed=embed)
-                except:
-                    break  # Message deleted or error
-        await asyncio.sleep(5)  # Update every 5 seconds
-
-async def play_next(guild_id):
-    if queue.get(guild_id):
-        url, title = queue[guild_id].pop(0)
-        logger.info(f"Phát tiếp: {title}")
-        vc = bot.get_guild(guild_id).voice_client
-        if not vc or not vc.is_connected():
-            logger.warning("Voice client không kết nối, bỏ qua bài này")
-            return
-        try:
-            player = await Player.create(url, bot.loop)
-            current_song[guild_id] = {
-                'url': url,
-                'title': title,
-                'start_time': time.time(),
-                'duration': player.duration,
-                'message': None
-            }
-            # Auto now playing
-            if auto_now_playing.get(guild_id, False) and auto_now_playing_channel.get(guild_id):
-                channel = bot.get_channel(auto_now_playing_channel[guild_id])
-                if channel:
-                    embed = Embed(title="🎵 Now Playing", color=0x00ff00)
-                    embed.add_field(name=title, value=f"0:00 / {format_time(player.duration)}", inline=False)
-                    embed.add_field(name="Link", value=f"[YouTube]({url})", inline=False)
-                    message = await channel.send(embed=embed)
-                    current_song[guild_id]['message'] = message
-                    asyncio.create_task(update_now_playing(guild_id))
-            vc.play(player, after=lambda e: asyncio.run_coroutine_threadsafe(play_next(guild_id), bot.loop) if not e else logger.error(f"Player error: {e}"))
-        except Exception as e:
-            logger.error(f"Lỗi play_next: {e}")
-    else:
-        # No more songs, clear current song
-        current_song.pop(guild_id, None)
+@bot.event
+async def setup_hook():
+    # Chạy sau khi login, trước khi kết nối gateway: làm nóng pool trích xuất song song với lúc chờ ready
+    startup.mark('login')
+    asyncio.create_task(resolver.warm_up())
 
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
+    resolver.start()
+    audio_cache.load()
+    searcher.start()
+    state_store.start(players)
+    await monitor.start(players)
+    reaper.start(players)
+    if is_primary():
+        await startup.sync_tree(bot)
+    startup.finish(metrics)
     logger.info(f"DJ_TET v2 đã sẵn sàng! ID: {bot.user}")
 
+@bot.event
+async def on_voice_state_update(member, before, after):
+    reaper.voice_state_update(member, before, after)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    # Tính từ lúc Discord tạo interaction: gồm cả độ trễ gateway lẫn thời gian bot xử lý
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.observe('dj_command_seconds', elapsed, command=command.name)
+
 @tree.command(name="play", description="DJ_TET phát nhạc từ từ khóa hoặc URL")
 async def play(interaction: discord.Interaction, query: str):
+    # Kiểm soát tải trước khi defer: vượt hạn mức thì báo ngay, chỉ người gọi thấy
+    try:
+        admission.admit(interaction, 'play')
+    except Overloaded as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
     try:
         await interaction.response.defer(ephemeral=False)
     except discord.errors.HTTPException:
@@ -146,119 +137,234 @@ async def play(interaction: discord.Interaction, query: str):
         await interaction.followup.send("Vào voice channel trước nhé!")
         return
 
-    vc = interaction.guild.voice_client
-    if not vc:
-        try:
-            vc = await interaction.user.voice.channel.connect()
-            logger.info(f"Đã vào voice: {vc.channel.name}")
-        except Exception as e:
-            await interaction.followup.send("Không thể vào voice!")
-            return
-
-    guild_id = interaction.guild.id
-    queue.setdefault(guild_id, [])
+    gp = players.get(interaction.guild.id)
+    try:
+        await gp.join(interaction.user.voice.channel)
+    except Exception as e:
+        await interaction.followup.send("Không thể vào voice!")
+        return
 
     try:
         if is_youtube_url(query):
             url = query
-            info = ytdl.extract_info(url, download=False)
-            title = info.get('title', 'Unknown')
-            duration = info.get('duration', 0)
+            info = await resolver.extract(url, timeout=time_left(interaction))
+            track = Track.from_info(info)
+            title = track.title
         else:
-            search = Search(query)
-            if not search.results:
+            results = await searcher.search(query, timeout=time_left(interaction))
+            if not results:
                 await interaction.followup.send("DJ_TET không tìm thấy bài nào!")
                 return
-            video = search.results[0]
-            url = f"https://www.youtube.com/watch?v={video.video_id}"
-            title = video.title
-            duration = video.length
+            video = results[0]
+            track = Track.from_info(video)
+            url, title = track.url, track.title
             logger.info(f"Tìm thấy: {title} → {url}")
+    except ResolverBusy as e:
+        await interaction.followup.send(str(e))
+        return
+    except asyncio.TimeoutError:
+        await interaction.followup.send("Tìm kiếm quá lâu, thử lại sau nhé!")
+        return
     except Exception as e:
         logger.error(f"Lỗi xử lý query: {e}")
         await interaction.followup.send(f"Lỗi tìm kiếm: {str(e)[:100]}...")
         return
 
-    queue[guild_id].append((url, title))
+    started = await gp.enqueue([track])
+    await interaction.followup.send(f"**DJ_TET** {'đang phát' if started else 'thêm vào hàng đợi'}: **{title}**")
+
+@play.autocomplete('query')
+async def play_autocomplete(interaction: discord.Interaction, current: str):
+    # Gợi ý từ các bài đã phát, chọn gợi ý = phát thẳng theo URL
+    return [app_commands.Choice(name=r['title'][:100], value=r['url']) for r in search_index.suggest(current)]
+
+@tree.command(name="playlist", description="Thêm cả playlist/mix YouTube vào hàng đợi")
+async def play_playlist(interaction: discord.Interaction, url: str):
+    try:
+        admission.admit(interaction, 'playlist', cost=3)
+    except Overloaded as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
+    await interaction.response.defer()
+    logger.info(f"/playlist: {url}")
+
+    if not is_playlist_url(url):
+        await interaction.followup.send("Đây không phải link playlist/mix YouTube!")
+        return
+    if not interaction.user.voice:
+        await interaction.followup.send("Vào voice channel trước nhé!")
+        return
+
+    guild_id = interaction.guild.id
+    gp = players.get(guild_id)
+    try:
+        await gp.join(interaction.user.voice.channel)
+    except Exception as e:
+        logger.error(f"Lỗi kết nối voice: {e}")
+        await interaction.followup.send("Không thể vào voice!")
+        return
+
+    limit = PLAYLIST_MAX_ENTRIES - len(gp.queue)
+    if limit <= 0:
+        await interaction.followup.send(f"Hàng đợi đã đủ {PLAYLIST_MAX_ENTRIES} bài!")
+        return
+
+    message = await interaction.followup.send("**DJ_TET** đang nhập playlist...", wait=True)
 
-    if not vc.is_playing():
-        asyncio.create_task(play_next(guild_id))
+    async def add_batch(entries):
+        await gp.enqueue(Track.from_info(e) for e in entries)
 
-    await interaction.followup.send(f"**DJ_TET** {'đang phát' if not vc.is_playing() else 'thêm vào hàng đợi'}: **{title}**")
+    async def progress(count, title, done):
+        text = f"**DJ_TET** đã thêm {count} bài từ **{title}**" + ("" if done else "...")
+        try:
+            await message.edit(content=text)
+        except discord.HTTPException:
+            pass  # Token interaction hết hạn, bỏ qua tiến độ
+
+    task = start_import(guild_id, url, limit, add_batch, progress)
+    if task is None:
+        await message.edit(content="Đang nhập một playlist khác, dùng /clear để hủy!")
+        return
+    try:
+        await task
+    except asyncio.CancelledError:
+        await message.edit(content="Đã dừng nhập playlist!")
+    except ResolverBusy as e:
+        await message.edit(content=str(e))
+    except asyncio.TimeoutError:
+        await message.edit(content="Nhập playlist quá lâu, thử lại sau nhé!")
+    except Exception as e:
+        logger.error(f"Lỗi nhập playlist: {e}")
+        await message.edit(content=f"Lỗi nhập playlist: {str(e)[:100]}")
 
 @tree.command(name="nowplaying", description="Hiển thị bài đang phát")
 async def now_playing(interaction: discord.Interaction):
     await interaction.response.defer()
     guild_id = interaction.guild.id
-    if guild_id in current_song:
-        np = current_song[guild_id]
-        current_time = time.time() - np['start_time']
-        progress_bar = create_progress_bar(current_time, np['duration'])
-        embed = Embed(title="🎵 Now Playing", color=0x00ff00)
-        embed.add_field(name=np['title'], value=f"{progress_bar}\n{format_time(current_time)} / {format_time(np['duration'])}", inline=False)
-        embed.add_field(name="Link", value=f"[YouTube]({np['url']})", inline=False)
-        message = await interaction.followup.send(embed=embed)
-        current_song[guild_id]['message'] = message
-        # Start updating task
-        asyncio.create_task(update_now_playing(guild_id))
+    np = players.get(guild_id).current
+    if np:
+        message = await interaction.followup.send(embed=now_playing_embed(np))
+        track_now_playing(guild_id, np, message)
     else:
         await interaction.followup.send("Không có bài nào đang phát!")
 
 @tree.command(name="autonowplaying", description="Bật/tắt auto now playing")
 async def auto_now_playing_cmd(interaction: discord.Interaction):
-    guild_id = interaction.guild.id
-    current = auto_now_playing.get(guild_id, False)
-    auto_now_playing[guild_id] = not current
-    if not current:
-        auto_now_playing_channel[guild_id] = interaction.channel.id
+    gp = players.get(interaction.guild.id)
+    if not gp.settings.get('auto_now_playing_channel'):
+        await gp.set_setting('auto_now_playing_channel', interaction.channel.id)
         await interaction.response.send_message("Đã bật auto now playing! Giao diện sẽ tự động hiển thị khi phát nhạc.")
     else:
-        auto_now_playing_channel.pop(guild_id, None)
+        await gp.set_setting('auto_now_playing_channel', None)
         await interaction.response.send_message("Đã tắt auto now playing!")
 
 # Copy other commands from v1...
 
+@tree.command(name="radio", description="Nghe kênh radio chung của DJ_TET")
+async def radio(interaction: discord.Interaction, station: str):
+    await interaction.response.defer()
+    if station not in stations:
+        await interaction.followup.send("Không có kênh radio này!")
+        return
+    if not interaction.user.voice:
+        await interaction.followup.send("Vào voice channel trước nhé!")
+        return
+    gp = players.get(interaction.guild.id)
+    try:
+        await gp.join(interaction.user.voice.channel)
+        await gp.listen(stations[station])
+    except Exception as e:
+        logger.error(f"Lỗi radio: {e}")
+        await interaction.followup.send(f"Không mở được radio: {str(e)[:100]}")
+        return
+    now = stations[station].title
+    await interaction.followup.send(f"**DJ_TET** đang phát radio **{station}**" + (f": **{now}**" if now else ""))
+
+@radio.autocomplete('station')
+async def radio_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=f"{name} ({len(s.listeners)} đang nghe)", value=name)
+            for name, s in stations.items() if current.lower() in name.lower()][:25]
+
 @tree.command(name="stop", description="Dừng phát nhạc và rời voice")
 async def stop(interaction: discord.Interaction):
-    vc = interaction.guild.voice_client
-    if vc:
-        vc.stop()
-        await vc.disconnect()
-        queue[interaction.guild.id] = []
-        current_song.pop(interaction.guild.id, None)
+    if interaction.guild.voice_client:
+        await players.get(interaction.guild.id).stop()
+        now_playing_scheduler.stop(interaction.guild.id)
         await interaction.response.send_message("Đã dừng và rời voice!")
     else:
         await interaction.response.send_message("Bot không ở trong voice!")
 
 @tree.command(name="skip", description="Bỏ qua bài hiện tại")
 async def skip(interaction: discord.Interaction):
-    vc = interaction.guild.voice_client
-    if vc and vc.is_playing():
-        vc.stop()
+    if await players.get(interaction.guild.id).skip():
         await interaction.response.send_message("Đã bỏ qua bài hiện tại!")
     else:
         await interaction.response.send_message("Không có bài nào đang phát!")
 
+@tree.command(name="pause", description="Tạm dừng bài hiện tại")
+async def pause(interaction: discord.Interaction):
+    if await players.get(interaction.guild.id).pause():
+        await interaction.response.send_message("Đã tạm dừng!")
+    else:
+        await interaction.response.send_message("Không có bài nào đang phát!")
+
+@tree.command(name="resume", description="Tiếp tục phát bài đang tạm dừng")
+async def resume(interaction: discord.Interaction):
+    if await players.get(interaction.guild.id).resume():
+        await interaction.response.send_message("Tiếp tục phát!")
+    else:
+        await interaction.response.send_message("Không có bài nào đang tạm dừng!")
+
+def parse_time(text):
+    # "90" -> 90, "1:30" -> 90, "1:02:03" -> 3723
+    seconds = 0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+async def seek_to(interaction, seconds):
+    position = await players.get(interaction.guild.id).seek(seconds)
+    if position is None:
+        await interaction.response.send_message("Không có bài nào đang phát!")
+    else:
+        await interaction.response.send_message(f"Đã tua tới {format_time(position)}")
+
+@tree.command(name="seek", description="Tua tới vị trí (giây hoặc phút:giây)")
+async def seek(interaction: discord.Interaction, position: str):
+    try:
+        seconds = parse_time(position)
+    except ValueError:
+        await interaction.response.send_message("Vị trí không hợp lệ! Ví dụ: 90 hoặc 1:30")
+        return
+    await seek_to(interaction, seconds)
+
+@tree.command(name="forward", description="Tua tới thêm vài giây")
+async def forward(interaction: discord.Interaction, seconds: int = 10):
+    await seek_to(interaction, players.get(interaction.guild.id).position() + seconds)
+
+@tree.command(name="rewind", description="Tua lùi vài giây")
+async def rewind(interaction: discord.Interaction, seconds: int = 10):
+    await seek_to(interaction, players.get(interaction.guild.id).position() - seconds)
+
 @tree.command(name="queue", description="Hiển thị hàng đợi nhạc")
 async def show_queue(interaction: discord.Interaction):
-    guild_id = interaction.guild.id
-    if queue.get(guild_id):
-        queue_list = "\n".join(f"{i+1}. {title}" for i, (_, title) in enumerate(queue[guild_id]))
-        await interaction.response.send_message(f"**Hàng đợi:**\n{queue_list}")
-    else:
+    gp = players.get(interaction.guild.id)
+    if not gp.queue:
         await interaction.response.send_message("Hàng đợi trống!")
+        return
+    # Chỉ render trang đầu; các trang sau render khi bấm nút
+    view = QueueView(gp)
+    await interaction.response.send_message(embed=view.render(), view=view)
+    view.message = await interaction.original_response()
 
 @tree.command(name="clear", description="Xóa hàng đợi")
 async def clear_queue(interaction: discord.Interaction):
-    guild_id = interaction.guild.id
-    queue[guild_id] = []
+    await players.get(interaction.guild.id).clear()
     await interaction.response.send_message("Đã xóa hàng đợi!")
 
 @tree.command(name="shuffle", description="Xáo trộn hàng đợi")
 async def shuffle_queue(interaction: discord.Interaction):
-    guild_id = interaction.guild.id
-    if queue.get(guild_id) and len(queue[guild_id]) > 1:
-        random.shuffle(queue[guild_id])
+    if await players.get(interaction.guild.id).shuffle():
         await interaction.response.send_message("Đã xáo trộn hàng đợi!")
     else:
         await interaction.response.send_message("Hàng đợi cần ít nhất 2 bài để xáo trộn!")
@@ -270,17 +376,17 @@ class RepeatView(View):
 
     @discord.ui.button(label="Tắt", style=discord.ButtonStyle.secondary)
     async def off(self, interaction: discord.Interaction, button: Button):
-        repeat_mode[self.guild_id] = 0
+        await players.get(self.guild_id).set_repeat(0)
         await interaction.response.send_message("Chế độ lặp: tắt")
 
     @discord.ui.button(label="Bài hiện tại", style=discord.ButtonStyle.primary)
     async def song(self, interaction: discord.Interaction, button: Button):
-        repeat_mode[self.guild_id] = 1
+        await players.get(self.guild_id).set_repeat(1)
         await interaction.response.send_message("Chế độ lặp: bài hiện tại")
 
     @discord.ui.button(label="Toàn queue", style=discord.ButtonStyle.primary)
     async def queue(self, interaction: discord.Interaction, button: Button):
-        repeat_mode[self.guild_id] = 2
+        await players.get(self.guild_id).set_repeat(2)
         await interaction.response.send_message("Chế độ lặp: toàn queue")
 
 @tree.command(name="repeat", description="Chọn chế độ lặp")
@@ -290,21 +396,17 @@ async def set_repeat(interaction: discord.Interaction):
 
 @tree.command(name="remove", description="Xóa bài tại vị trí")
 async def remove_song(interaction: discord.Interaction, position: int):
-    guild_id = interaction.guild.id
-    if queue.get(guild_id) and 1 <= position <= len(queue[guild_id]):
-        removed = queue[guild_id].pop(position - 1)
-        await interaction.response.send_message(f"Đã xóa: {removed[1]}")
+    removed = await players.get(interaction.guild.id).remove(position - 1)
+    if removed:
+        await interaction.response.send_message(f"Đã xóa: {removed.title}")
     else:
         await interaction.response.send_message("Vị trí không hợp lệ!")
 
 @tree.command(name="move", description="Di chuyển bài từ vị trí A đến B")
 async def move_song(interaction: discord.Interaction, from_pos: int, to_pos: int):
-    guild_id = interaction.guild.id
-    q = queue.get(guild_id, [])
-    if q and 1 <= from_pos <= len(q) and 1 <= to_pos <= len(q):
-        song = q.pop(from_pos - 1)
-        q.insert(to_pos - 1, song)
-        await interaction.response.send_message(f"Đã di chuyển {song[1]} đến vị trí {to_pos}")
+    song = await players.get(interaction.guild.id).move(from_pos - 1, to_pos - 1)
+    if song:
+        await interaction.response.send_message(f"Đã di chuyển {song.title} đến vị trí {to_pos}")
     else:
         await interaction.response.send_message("Vị trí không hợp lệ!")
 
@@ -320,60 +422,79 @@ class SearchView(View):
 
     def create_callback(self, index):
         async def callback(interaction: discord.Interaction):
+            try:
+                admission.admit(interaction, 'play')
+            except Overloaded as e:
+                await interaction.response.send_message(str(e), ephemeral=True)
+                return
             if not interaction.user.voice:
                 await interaction.response.send_message("Vào voice channel trước nhé!")
                 return
 
-            vc = bot.get_guild(self.guild_id).voice_client
-            if not vc:
-                try:
-                    vc = await interaction.user.voice.channel.connect()
-                except Exception as e:
-                    await interaction.response.send_message("Không thể vào voice!")
-                    return
-
-            song = self.results[index]
-            url = song['url']
-            title = song['title']
-            queue.setdefault(self.guild_id, [])
-            queue[self.guild_id].append((url, title))
-            was_playing = vc.is_playing() if vc else False
-            if not was_playing:
-                asyncio.create_task(play_next(self.guild_id))
+            gp = players.get(self.guild_id)
+            try:
+                await gp.join(interaction.user.voice.channel)
+            except Exception as e:
+                await interaction.response.send_message("Không thể vào voice!")
+                return
+
+            track = Track.from_info(self.results[index])
+            title = track.title
+            await gp.enqueue([track])
             await interaction.response.send_message(f"Đã thêm: {title}")
         return callback
 
 @tree.command(name="search", description="Tìm kiếm nhạc trên YouTube")
 async def search_songs(interaction: discord.Interaction, query: str):
+    try:
+        admission.admit(interaction, 'search')
+    except Overloaded as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
     await interaction.response.defer()
     try:
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'noplaylist': True,
-            'quiet': True,
-            'extract_flat': True,
-            'skip_download': True
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch5:{query}", download=False)
-            results = info.get('entries', [])[:5]
+        results = await searcher.search(query, limit=5, primary='ytdlp', timeout=time_left(interaction))
         if not results:
             await interaction.followup.send("Không tìm thấy kết quả!")
             return
         titles = "\n".join(f"{i+1}. {r['title']}" for i, r in enumerate(results))
         view = SearchView(results, interaction.guild.id)
         await interaction.followup.send(f"Kết quả tìm kiếm cho '{query}':\n{titles}", view=view)
+    except ResolverBusy as e:
+        await interaction.followup.send(str(e))
+    except asyncio.TimeoutError:
+        await interaction.followup.send("Tìm kiếm quá lâu, thử lại sau nhé!")
     except Exception as e:
         await interaction.followup.send(f"Lỗi tìm kiếm: {str(e)[:100]}")
 
+@search_songs.autocomplete('query')
+async def search_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=r['title'][:100], value=r['title'][:100]) for r in search_index.suggest(current)]
+
+@tree.command(name="profile", description="(Admin) Chạy sampling profiler và gửi kết quả")
+@app_commands.default_permissions(administrator=True)
+async def profile_command(interaction: discord.Interaction, seconds: int = 10):
+    if profiler.is_running():
+        await interaction.response.send_message("Đang có một phiên profile khác!", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    path, samples, hottest = await profiler.profile(seconds)
+    lines = "\n".join(f"{count * 100 / samples:5.1f}% {name}" for name, count in hottest) if samples else ""
+    await interaction.followup.send(f"Profile {samples} mẫu:\n```{lines[:1800]}```", file=discord.File(path), ephemeral=True)
+
 @tree.command(name="help", description="Hướng dẫn sử dụng bot")
 async def help_command(interaction: discord.Interaction):
     embed = discord.Embed(title="🎵 DJ_TET Bot v2 - Hướng dẫn sử dụng", color=0x00ff00)
     embed.add_field(
         name="🎶 Phát nhạc",
         value="`/play <tên bài/url>` - Phát nhạc từ YouTube\n"
+              "`/playlist <url>` - Thêm cả playlist/mix YouTube\n"
+              "`/radio <kênh>` - Nghe radio chung với các server khác\n"
               "`/stop` - Dừng phát và rời voice\n"
-              "`/skip` - Bỏ qua bài hiện tại",
+              "`/skip` - Bỏ qua bài hiện tại\n"
+              "`/pause` / `/resume` - Tạm dừng / tiếp tục\n"
+              "`/seek <vị trí>` - Tua tới vị trí (vd. 1:30)\n"
+              "`/forward` / `/rewind` - Tua tới / lùi 10 giây",
         inline=False
     )
     embed.add_field(
@@ -405,4 +526,5 @@ async def help_command(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 # === CHẠY BOT ===
-bot.run(os.getenv('DISCORD_TOKEN'))
+if __name__ == '__main__':
+    bot.run(os.getenv('DISCORD_TOKEN'))
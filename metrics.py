@@ -0,0 +1,99 @@
+# metrics.py - DJ_TET bộ đếm / histogram trong process, xuất dạng text Prometheus
+import bisect
+import time
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+
+    def __init__(self, buckets=None):
+        if buckets is not None:
+            self.BUCKETS = buckets
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        # Cận trên của bucket chứa quantile q (ước lượng thô, đủ để đặt deadline hedge)
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else self.BUCKETS[-1] * 2
+        return self.BUCKETS[-1] * 2
+
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2.5)  # jitter frame, loop lag
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class Metrics:
+    # Ghi số liệu chỉ là cộng số trong dict: không lock, không I/O; đọc/format chỉ khi có request /metrics
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> số
+        self.histograms = {}  # (name, labels) -> LatencyHistogram
+        self.buckets = {}  # name -> buckets riêng
+        self.collectors = []  # fn() -> [(name, labels dict, value)] dạng gauge, gọi lúc xuất
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = self.histograms[key] = LatencyHistogram(self.buckets.get(name))
+        return hist
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+            seen = 0
+            for bound, count in zip(hist.BUCKETS, hist.counts):
+                seen += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {seen}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {hist.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        for fn in self.collectors:
+            for name, labels, value in fn():
+                lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.buckets['dj_frame_jitter_seconds'] = FAST_BUCKETS
+metrics.buckets['dj_event_loop_lag_seconds'] = FAST_BUCKETS
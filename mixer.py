@@ -0,0 +1,150 @@
+# mixer.py - DJ_TET nối bài không khoảng lặng: crossfade đuôi bài đang phát với đầu bài kế (đã mở sẵn) trên cùng AudioPlayer
+import logging
+import os
+import threading
+from functools import lru_cache
+
+import discord
+
+try:
+    import numpy
+except ImportError:  # không có NumPy: vẫn nối liền bài, chỉ bỏ crossfade
+    numpy = None
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+CROSSFADE_SECONDS = float(os.getenv('CROSSFADE_SECONDS', '5'))  # 0 = chỉ nối liền, không crossfade
+SKIP_FADE_SECONDS = 0.3  # /skip khi bài kế đã sẵn sàng: fade ngắn thay vì cắt ngang
+HANDOFF_LEAD = 3.0  # giao bài kế cho mixer sớm hơn lúc bắt đầu fade chừng này giây
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+FRAME_SAMPLES = discord.opus.Encoder.SAMPLES_PER_FRAME
+CHANNELS = discord.opus.Encoder.CHANNELS
+PCM_SILENCE = b'\x00' * discord.opus.Encoder.FRAME_SIZE
+
+
+def _cleanup(source):
+    threading.Thread(target=source.cleanup, daemon=True).start()  # không chờ kill FFmpeg trên thread audio
+
+
+@lru_cache(maxsize=1)
+def _sample_index():
+    # Chỉ số sample của từng giá trị int16 trong frame PCM xen kẽ L/R
+    return (numpy.arange(FRAME_SAMPLES * CHANNELS) // CHANNELS).astype(numpy.float32) + 0.5
+
+
+def crossfade(tail, head, index, frames):
+    # Một frame PCM s16le 20ms: tail giảm, head tăng theo equal-power (sin/cos) tính từng sample, tổng công suất giữ nguyên
+    t = (_sample_index() + index * FRAME_SAMPLES) * (numpy.pi / 2 / (frames * FRAME_SAMPLES))
+    mixed = numpy.frombuffer(tail, numpy.int16) * numpy.cos(t) + numpy.frombuffer(head, numpy.int16) * numpy.sin(t)
+    return numpy.clip(mixed, -32768, 32767).astype(numpy.int16).tobytes()
+
+
+class Mixer(discord.AudioSource):
+    # Nguồn của AudioPlayer cho cả một lượt phát liên tục: đổi bài ngay trong read(), không dừng/mở lại AudioPlayer
+    def __init__(self, source, on_switch):
+        self.current = source  # player.Tracked
+        self.on_switch = on_switch  # (track, source) gọi từ thread audio khi bài kế bắt đầu phát
+        self.fading = None  # bài cũ đang fade out
+        self.fade_index = 0
+        self.fade_frames = 0
+        self._next = None  # (track, source) actor giao trước khi bài hiện tại hết
+        self._replace = None  # source mới sau /seek
+        self._advance = False
+        self._lock = threading.Lock()
+
+    @property
+    def original(self):
+        return self.current  # cho player.unwrap
+
+    @property
+    def _current_error(self):
+        # AudioPlayer đọc khi read() trả về rỗng: lỗi FFmpeg của bài đang phát tới được callback after
+        return getattr(self.current, '_current_error', None)
+
+    def sources(self):
+        return [s for s in (self.current, self.fading, self._replace, self._next and self._next[1]) if s is not None]
+
+    # === GỌI TỪ EVENT LOOP ===
+    def queue_next(self, track, source):
+        with self._lock:
+            old, self._next = self._next, (track, source)
+        if old is not None:
+            old[1].cleanup()
+
+    def retract(self, keep=None):
+        # Queue đổi sau khi đã giao bài kế: bỏ bài đã giao nếu nó không còn đứng đầu
+        with self._lock:
+            if self._next is None or self._next[0] is keep:
+                return False
+            _, source = self._next
+            self._next = None
+            self._advance = False
+        source.cleanup()
+        return True
+
+    def advance(self):
+        with self._lock:
+            if self._next is None:
+                return False
+            self._advance = True
+            return True
+
+    def replace(self, source):
+        self._replace = source
+
+    # === THREAD AUDIO ===
+    def _fade_due(self):
+        if self._advance:
+            return True
+        source = self.current
+        return CROSSFADE_SECONDS > 0 and source.duration and source.position >= source.duration - CROSSFADE_SECONDS
+
+    def _switch(self, fade):
+        with self._lock:
+            track, source = self._next
+            self._next = None
+            self._advance = False
+        old, self.current = self.current, source
+        if fade > 0 and numpy is not None and not old.is_opus() and not source.is_opus():
+            self.fading = old
+            self.fade_index = 0
+            self.fade_frames = max(1, round(fade / FRAME_SECONDS))
+        else:
+            _cleanup(old)  # Opus đi thẳng (không decode được để trộn): nối liền, không fade
+        self.on_switch(track, source)
+
+    def _mix(self, head):
+        tail = self.fading.read() if self.fade_index < self.fade_frames else b''
+        if not tail:
+            _cleanup(self.fading)
+            self.fading = None
+            return head
+        mixed = crossfade(tail, head or PCM_SILENCE, self.fade_index, self.fade_frames)
+        self.fade_index += 1
+        return mixed
+
+    def read(self):
+        if self._replace is not None:
+            old, self.current, self._replace = self.current, self._replace, None
+            _cleanup(old)
+        if self._next is not None and self.fading is None and self._fade_due():
+            source = self.current
+            remaining = (source.duration or 0) - source.position
+            self._switch(SKIP_FADE_SECONDS if self._advance else min(CROSSFADE_SECONDS, remaining))
+        data = self.current.read()
+        if not data and self._next is not None:
+            self._switch(0)  # hết sớm hơn duration / crossfade tắt: nối liền sang bài kế
+            data = self.current.read()
+        if self.fading is not None:
+            data = self._mix(data)
+        return data
+
+    def is_opus(self):
+        return self.current.is_opus()
+
+    def cleanup(self):
+        for source in self.sources():
+            source.cleanup()
+        self.fading = self._replace = self._next = None
@@ -0,0 +1,122 @@
+# monitoring.py - DJ_TET endpoint /metrics (Prometheus), đo event loop lag, profile qua signal
+import asyncio
+import logging
+import math
+import os
+import signal
+import time
+from collections import Counter
+
+import prefetch
+import profiler
+from admission import admission
+from audio_cache import audio_cache
+from extractor import resolver
+from loudness import loudness_table
+from metrics import metrics
+from nowplaying import now_playing_scheduler
+from radio import stations
+from search import searcher
+from shared_cache import shared_cache
+from state_store import state_store
+from track_cache import track_cache
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # 0 = tắt endpoint
+LOOP_LAG_INTERVAL = 0.25
+
+
+def _cache_stats(prefix, stats):
+    return [(f"{prefix}_{key}", {}, value) for key, value in stats.items() if isinstance(value, (int, float))]
+
+
+def collect_caches():
+    rows = _cache_stats('dj_track_cache', track_cache.stats())
+    rows += _cache_stats('dj_audio_cache', audio_cache.stats())
+    rows += _cache_stats('dj_singleflight', resolver.flights.stats())
+    rows += _cache_stats('dj_state', state_store.stats())
+    rows += _cache_stats('dj_shared_cache', shared_cache.stats())
+    rows += _cache_stats('dj_loudness', loudness_table.stats())
+    rows += _cache_stats('dj_admission', admission.stats())
+    search = searcher.stats()
+    rows += [(f"dj_search_{key}", {}, search[key]) for key in ('local_hits', 'hedges', 'hedge_wins')]
+    rows += [('dj_search_index_docs', {}, len(searcher.index))]
+    rows += [('dj_resolver_pending', {}, resolver.pending), ('dj_prefetch_warm_procs', {}, prefetch.warm_procs)]
+    rows += [('dj_nowplaying_edits', {}, now_playing_scheduler.edits),
+             ('dj_nowplaying_unchanged', {}, now_playing_scheduler.unchanged),
+             ('dj_nowplaying_active', {}, len(now_playing_scheduler.active))]
+    for name, station in stations.items():
+        rows.append(('dj_radio_listeners', {'station': name}, len(station.listeners)))
+        rows.append(('dj_radio_frames', {'station': name}, station.seq))
+    return rows
+
+
+class Monitor:
+    def __init__(self):
+        self.registry = None
+        self.loop_lag = 0.0
+        self._runner = None
+        self._lag_task = None
+
+    def collect_players(self):
+        players = list(self.registry.players.values()) if self.registry else []
+        states = Counter(gp.state for gp in players)
+        rows = [('dj_players', {'state': state}, count) for state, count in states.items()]
+        rows.append(('dj_queue_tracks', {}, sum(len(gp.queue) for gp in players)))
+        rows.append(('dj_queue_max_length', {}, max((len(gp.queue) for gp in players), default=0)))
+        rows.append(('dj_event_loop_lag_last_seconds', {}, self.loop_lag))
+        if self.registry:
+            bot = self.registry.bot
+            rows.append(('dj_guilds', {}, len(bot.guilds)))
+            # AutoShardedBot có latency riêng cho từng shard; Bot thường chỉ có một
+            for shard_id, latency in getattr(bot, 'latencies', [(0, bot.latency)]):
+                if math.isfinite(latency):
+                    rows.append(('dj_gateway_latency_seconds', {'shard': shard_id}, latency))
+        return rows
+
+    async def _measure_loop_lag(self):
+        # Ngủ một khoảng cố định: trễ thêm bao nhiêu là event loop bị chặn bấy nhiêu
+        hist = metrics.histogram('dj_event_loop_lag_seconds')
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL)
+            hist.observe(self.loop_lag)
+
+    async def _handle_metrics(self, request):
+        from aiohttp import web
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    def _on_signal(self):
+        if profiler.is_running():
+            logger.warning("Profile đang chạy, bỏ qua signal")
+            return
+        asyncio.create_task(profiler.profile())
+
+    async def start(self, registry):
+        if self._lag_task is not None:
+            return  # on_ready có thể chạy lại khi reconnect
+        self.registry = registry
+        metrics.collector(collect_caches)
+        metrics.collector(self.collect_players)
+        for name, hist in searcher.latency.items():
+            metrics.histograms[('dj_search_seconds', (('backend', name),))] = hist
+        self._lag_task = asyncio.create_task(self._measure_loop_lag())
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self._on_signal)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass  # Windows: chỉ dùng lệnh /profile
+        if METRICS_PORT:
+            from aiohttp import web  # aiohttp.web chỉ cần khi bật endpoint, không import lúc khởi động
+            app = web.Application()
+            app.router.add_get('/metrics', self._handle_metrics)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, METRICS_HOST, METRICS_PORT).start()
+            logger.info(f"Metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
+monitor = Monitor()
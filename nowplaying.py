@@ -0,0 +1,81 @@
+# nowplaying.py - DJ_TET: một scheduler chung cập nhật tất cả tin nhắn Now Playing
+import asyncio
+import logging
+import os
+
+import discord
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+NOW_PLAYING_INTERVAL = float(os.getenv('NOW_PLAYING_INTERVAL', '5'))  # mỗi tin nhắn sửa tối đa 1 lần / 5s
+CHANNEL_EDIT_INTERVAL = float(os.getenv('CHANNEL_EDIT_INTERVAL', '1'))  # khoảng cách tối thiểu giữa 2 lần sửa trong 1 kênh
+TICK = 1.0
+
+
+class NowPlayingScheduler:
+    def __init__(self, interval=NOW_PLAYING_INTERVAL):
+        self.interval = interval
+        self.active = {}  # guild_id -> {'message', 'render', 'last', 'next_at'}
+        self.channel_next = {}  # channel_id -> thời điểm được sửa tiếp (bucket rate limit theo kênh)
+        self.task = None
+        self.edits = 0
+        self.unchanged = 0
+
+    def track(self, guild_id, message, render):
+        # render() trả về Embed hiện tại, hoặc None khi bài đã kết thúc
+        loop = asyncio.get_running_loop()
+        self.active[guild_id] = {'message': message, 'render': render, 'last': None, 'next_at': loop.time() + self.interval}
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def stop(self, guild_id, message=None):
+        entry = self.active.get(guild_id)
+        if entry and (message is None or entry['message'] is message):
+            del self.active[guild_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self.active:
+            now = loop.time()
+            due = []
+            for guild_id, entry in list(self.active.items()):
+                channel_id = entry['message'].channel.id
+                if entry['next_at'] > now or self.channel_next.get(channel_id, 0) > now:
+                    continue
+                embed = entry['render']()
+                if embed is None:
+                    self.stop(guild_id, entry['message'])
+                    continue
+                entry['next_at'] = now + self.interval
+                data = embed.to_dict()
+                if data == entry['last']:
+                    self.unchanged += 1
+                    continue
+                entry['last'] = data
+                self.channel_next[channel_id] = now + CHANNEL_EDIT_INTERVAL
+                due.append(self._edit(guild_id, entry, embed))
+            if due:
+                await asyncio.gather(*due)
+            await asyncio.sleep(TICK)
+        self.channel_next.clear()
+
+    async def _edit(self, guild_id, entry, embed):
+        message = entry['message']
+        try:
+            await message.edit(embed=embed)
+            self.edits += 1
+        except discord.NotFound:
+            self.stop(guild_id, message)  # tin nhắn đã bị xoá
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = getattr(e, 'retry_after', None) or 5
+                loop = asyncio.get_running_loop()
+                self.channel_next[message.channel.id] = loop.time() + retry_after
+                entry['last'] = None
+            else:
+                logger.warning(f"Không sửa được Now Playing (guild {guild_id}): {e}")
+                self.stop(guild_id, message)
+
+
+now_playing_scheduler = NowPlayingScheduler()
@@ -0,0 +1,282 @@
+# player.py - DJ_TET audio source dùng chung cho main.py và main_v2.py
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+
+import discord
+
+from audio_cache import audio_cache
+from extractor import resolver, video_id
+from loudness import loudness_table
+from metrics import metrics
+from track_cache import expiry_from_url
+
+logger = logging.getLogger("DJ_TET")
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+ffmpeg_sources = weakref.WeakSet()  # mọi source FFmpeg đã mở, để reaper tìm process mồ côi
+first_frame = metrics.histogram('dj_first_frame_seconds')
+frame_jitter = metrics.histogram('dj_frame_jitter_seconds')
+failover_gap = metrics.histogram('dj_failover_gap_seconds')  # khoảng lặng mỗi lần đổi nguồn giữa bài
+
+# === FAILOVER ===
+FAILOVER_MAX_GAP = float(os.getenv('FAILOVER_MAX_GAP', '30'))  # phát lặng tối đa chừng này giây chờ nguồn mới
+FAILOVER_MAX_PER_TRACK = int(os.getenv('FAILOVER_MAX_PER_TRACK', '3'))
+FAILOVER_END_MARGIN = 3.0  # hết stream trong 3 giây cuối bài = hết bài bình thường
+FAILOVER_LEAD = float(os.getenv('FAILOVER_LEAD', '120'))  # đổi nguồn trước khi stream URL hết hạn chừng này giây
+# Thử lần lượt sau khi lấy lại URL bestaudio vẫn lỗi: m4a / itag 18 thường nằm trên server googlevideo khác
+FAILOVER_FORMATS = [f for f in os.getenv('FAILOVER_FORMATS', 'bestaudio[ext=m4a];18').split(';') if f]
+PCM_SILENCE = b'\x00' * discord.opus.Encoder.FRAME_SIZE
+OPUS_SILENCE = b'\xf8\xff\xfe'
+
+# === FFMPEG CONFIG ===
+# PLAYER_MODE=pcm: FFmpeg -> PCM -> libopus trong bot (mặc định)
+# PLAYER_MODE=opus: FFmpeg xuất thẳng Opus (hoặc copy stream webm/opus), bot không đụng tới PCM
+PLAYER_MODE = os.getenv('PLAYER_MODE', 'pcm')
+PLAYER_VOLUME = float(os.getenv('PLAYER_VOLUME', '0.5'))
+OPUS_BITRATE = int(os.getenv('OPUS_BITRATE', '128'))
+
+ffmpeg_options = {
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+}
+
+def track_volume(gain_db):
+    # PLAYER_VOLUME và gain chuẩn hoá loudness gộp thành một hệ số, áp đúng một lần trong FFmpeg
+    if gain_db is None:
+        return PLAYER_VOLUME
+    return round(PLAYER_VOLUME * 10 ** (gain_db / 20), 4)
+
+def filter_options(volume):
+    return f'-vn -filter:a "volume={volume}"'
+
+def before_options(start=0):
+    # -ss trước -i: FFmpeg tua trên input (nhanh, không decode phần bỏ qua)
+    if start > 0:
+        return f"{ffmpeg_options['before_options']} -ss {start:.2f}"
+    return ffmpeg_options['before_options']
+
+ffmpeg_path = os.getenv('FFMPEG_PATH', r"C:\Users\Admin\AppData\Local\Microsoft\WinGet\Packages\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\ffmpeg-8.0-full_build\bin\ffmpeg.exe")
+
+
+class Primed:
+    # Đọc trước frame đầu tiên (khi prefetch) rồi trả lại khi phát
+    _primed = None
+
+    def warm_up(self):
+        self._primed = super().read()
+        return bool(self._primed)
+
+    def read(self):
+        if self._primed is not None:
+            frame, self._primed = self._primed, None
+            return frame
+        return super().read()
+
+
+class PrimedPCMAudio(Primed, discord.FFmpegPCMAudio):
+    pass
+
+
+class Player(discord.AudioSource):
+    # Volume đã áp trong FFmpeg: không scale PCM lần nữa trên thread audio
+    def __init__(self, source, data, volume=PLAYER_VOLUME):
+        self.original = source
+        self.title = data.get('title', 'Unknown')
+        self.duration = data.get('duration', 0)
+        self.volume = volume
+
+    @classmethod
+    def from_data(cls, data, start=0, volume=PLAYER_VOLUME):
+        source = PrimedPCMAudio(data['url'], executable=ffmpeg_path,
+                                before_options=before_options(start), options=filter_options(volume))
+        return cls(source, data, volume)
+
+    @property
+    def _current_error(self):
+        return self.original._current_error  # FFmpeg thoát với mã lỗi, AudioPlayer báo qua after
+
+    def read(self):
+        return self.original.read()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+    def warm_up(self):
+        # Blocking: chạy trong thread, chờ FFmpeg spawn + kết nối xong
+        return self.original.warm_up()
+
+
+class OpusPlayer(Primed, discord.FFmpegOpusAudio):
+    # Gain được tính sẵn và áp trong FFmpeg; đổi volume = mở lại FFmpeg với gain mới
+    def __init__(self, data, volume=PLAYER_VOLUME, start=0):
+        self.title = data.get('title', 'Unknown')
+        self.duration = data.get('duration', 0)
+        self.volume = volume
+        if volume == 1.0 and data.get('acodec') == 'opus':
+            # YouTube trả webm/opus: chỉ remux sang Ogg, không decode/encode
+            codec, options = 'copy', '-vn'
+        else:
+            codec, options = 'libopus', filter_options(volume)
+        super().__init__(data['url'], bitrate=OPUS_BITRATE, codec=codec, executable=ffmpeg_path,
+                         before_options=before_options(start), options=options)
+
+
+class Tracked(discord.AudioSource):
+    # Đếm frame 20ms thực sự gửi đi: vị trí phát đúng cả khi buffer/reconnect, rẻ để đọc từ event loop
+    # Stream chết giữa bài (URL hết hạn, 403): phát lặng và báo on_stall, nguồn mới được ghép vào đúng frame đang phát
+    def __init__(self, source, start=0):
+        self.original = source
+        self.start = start
+        self.frames = 0
+        self.started = None  # perf_counter lúc vc.play, để đo thời gian tới frame đầu tiên
+        self.on_stall = None  # gọi từ thread audio khi source hết sớm
+        self.incoming = None  # (source, vị trí) chờ thread audio đổi vào
+        self.abandoned = False  # failover thất bại: để bài kết thúc
+        self.stalls = 0
+        self.stall_frames = 0
+        self._last_read = None
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)  # title, duration, warm_up, _current_error...
+
+    @property
+    def position(self):
+        return self.start + self.frames * FRAME_SECONDS
+
+    def read(self):
+        if self.incoming is not None:
+            self._swap()
+        try:
+            data = self.original.read()
+        except Exception as e:
+            logger.warning(f"Lỗi đọc audio: {e}")
+            data = b''
+        if not data:
+            return self._silence() if self._early() else b''
+        now = time.perf_counter()
+        if self._last_read is None:
+            if self.started is not None:
+                first_frame.observe(now - self.started)
+        elif now - self._last_read < 1:  # bỏ qua khoảng pause / tua
+            frame_jitter.observe(abs(now - self._last_read - FRAME_SECONDS))
+        self._last_read = now
+        self.frames += 1
+        return data
+
+    def _early(self):
+        if self.on_stall is None or self.abandoned or self.stall_frames * FRAME_SECONDS >= FAILOVER_MAX_GAP:
+            return False
+        if not self.stall_frames and self.stalls >= FAILOVER_MAX_PER_TRACK:
+            return False
+        return not self.duration or self.position < self.duration - FAILOVER_END_MARGIN
+
+    def _silence(self):
+        if not self.stall_frames:
+            self.stalls += 1
+            self.on_stall()
+        self.stall_frames += 1
+        return OPUS_SILENCE if self.original.is_opus() else PCM_SILENCE
+
+    def splice(self, source, start):
+        # Chạy trong thread: mở sẵn source mới (bắt đầu tại start) và đọc bỏ tới vị trí đang phát
+        if not source.warm_up():
+            return False
+        position = start
+        while position < self.position - FRAME_SECONDS / 2:
+            if not source.read():
+                return False
+            position += FRAME_SECONDS
+        self.incoming = (source, position)
+        return True
+
+    def _swap(self):
+        source, position = self.incoming
+        self.incoming = None
+        while position < self.position - FRAME_SECONDS / 2 and source.read():  # vài frame phát thêm trong lúc chờ
+            position += FRAME_SECONDS
+        old, self.original = self.original, source
+        failover_gap.observe(self.stall_frames * FRAME_SECONDS)
+        self.stall_frames = 0
+        self._last_read = None
+        threading.Thread(target=old.cleanup, daemon=True).start()  # không chờ kill FFmpeg cũ trên thread audio
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def drop_incoming(self):
+        if self.incoming is not None:
+            self.incoming[0].cleanup()
+            self.incoming = None
+
+    def cleanup(self):
+        self.drop_incoming()
+        self.original.cleanup()
+
+
+def unwrap(source):
+    # Tracked -> Player -> FFmpegPCMAudio
+    while not isinstance(source, discord.FFmpegAudio) and hasattr(source, 'original'):
+        source = source.original
+    return source
+
+
+async def create_player(url, start=0):
+    with metrics.timer('dj_create_player_seconds'):
+        return Tracked(await _open_source(url, start), start)
+
+
+async def create_opus_source(url):
+    # Luôn xuất Opus (radio: một nguồn phát chung cho nhiều voice client, không encode lại)
+    return await _open_source(url, 0, mode='opus')
+
+
+async def _open_source(url, start, mode=PLAYER_MODE):
+    # Có file Opus trong cache audio: phát thẳng từ đĩa, bỏ qua cả trích xuất lẫn tải về
+    vid = video_id(url)
+    gain_db = loudness_table.gain(vid)
+    volume = track_volume(gain_db)
+    cached = audio_cache.open(vid, volume, start) if vid else None
+    if cached:
+        if gain_db is None:
+            # File cache từ trước khi đo loudness: đo luôn trên file local, không tải lại
+            loudness_table.schedule(vid, audio_cache.path(vid), ffmpeg_path, 20 * math.log10(volume), cached.duration)
+        metrics.inc('dj_player_sources_total', source='cache')
+        return cached
+    try:
+        data = await resolver.extract(url)
+    except Exception as e:
+        logger.error(f"Lỗi tạo player: {e}")
+        raise
+    if gain_db is None and loudness_table.enabled:
+        # Lần phát đầu: đo nền song song; chỉ cache audio khi đã có gain để file trên đĩa luôn đã chuẩn hoá
+        loudness_table.schedule(vid, data['url'], ffmpeg_path, duration=data.get('duration'))
+    else:
+        audio_cache.fill(data, volume, ffmpeg_path)
+    metrics.inc('dj_player_sources_total', source='stream')
+    return _spawn(data, start, volume, mode)
+
+
+async def reopen(url, start, fmt=None):
+    # Failover: luôn lấy stream URL mới (URL cũ đã hết hạn / bị chặn), fmt = định dạng dự phòng
+    vid = video_id(url)
+    volume = track_volume(loudness_table.gain(vid))
+    cached = audio_cache.open(vid, volume, start) if vid and fmt is None else None
+    if cached:
+        return cached
+    data = await resolver.refresh(url, fmt=fmt)
+    return _spawn(data, start, volume, PLAYER_MODE)
+
+
+def _spawn(data, start, volume, mode):
+    with metrics.timer('dj_ffmpeg_spawn_seconds', mode=mode):
+        if mode == 'opus':
+            source = OpusPlayer(data, volume, start)
+        else:
+            source = Player.from_data(data, start, volume)
+    # googlevideo ghi hạn trong URL: bài dài / pause lâu thì đổi nguồn trước khi URL chết
+    source.expires_at = expiry_from_url(data['url']) if 'expire=' in data['url'] else None
+    ffmpeg_sources.add(unwrap(source))
+    return source
@@ -0,0 +1,64 @@
+# playlist.py - DJ_TET nhập playlist/mix YouTube theo từng đợt, phát ngay khi có bài đầu tiên
+import asyncio
+import logging
+import os
+import re
+
+from admission import BACKGROUND, priority
+from extractor import resolver
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+PLAYLIST_MAX_ENTRIES = int(os.getenv('PLAYLIST_MAX_ENTRIES', '500'))  # tối đa số bài trong queue mỗi guild
+PLAYLIST_BATCHES = (1, 24, 75, 200)  # đợt đầu 1 bài để phát ngay, sau đó tăng dần
+
+imports = {}  # guild_id -> asyncio.Task
+
+
+def is_playlist_url(url):
+    return re.search(r'[?&]list=[\w-]+', url) is not None
+
+
+def is_importing(guild_id):
+    task = imports.get(guild_id)
+    return task is not None and not task.done()
+
+
+def cancel_import(guild_id):
+    task = imports.pop(guild_id, None)
+    if task and not task.done():
+        task.cancel()
+        return True
+    return False
+
+
+async def _import(url, limit, add_batch, progress):
+    added, start, step = 0, 1, 0
+    title = 'Playlist'
+    while added < limit:
+        size = PLAYLIST_BATCHES[min(step, len(PLAYLIST_BATCHES) - 1)]
+        end = min(start + size - 1, start + limit - added - 1)
+        batch = await resolver.playlist(url, start, end)
+        title = batch['title']
+        entries = batch['entries']
+        if entries:
+            await add_batch(entries)
+            added += len(entries)
+            await progress(added, title, False)
+        if len(entries) < end - start + 1:
+            break  # hết playlist
+        start, step = end + 1, step + 1
+        priority.set(BACKGROUND)  # bài đầu đã có, các đợt sau nhường pool cho lệnh người dùng (context riêng của task)
+    await progress(added, title, True)
+    return added
+
+
+def start_import(guild_id, url, limit, add_batch, progress):
+    # add_batch(entries) thêm vào queue qua actor của guild, progress(count, title, done) báo tiến độ
+    if is_importing(guild_id):
+        return None
+    task = asyncio.create_task(_import(url, limit, add_batch, progress))
+    imports[guild_id] = task
+    task.add_done_callback(lambda t: imports.pop(guild_id, None) if imports.get(guild_id) is t else None)
+    return task
@@ -0,0 +1,118 @@
+# prefetch.py - DJ_TET look-ahead: resolve trước N bài kế tiếp, mở sẵn FFmpeg cho bài số 1
+import asyncio
+import logging
+import os
+
+from admission import BACKGROUND, priority
+from audio_cache import audio_cache
+from extractor import resolver, video_id
+from loudness import loudness_table
+from player import create_player, track_volume
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', '3'))
+PREFETCH_MAX_PROCS = int(os.getenv('PREFETCH_MAX_PROCS', '8'))  # tổng FFmpeg mở sẵn trên node
+PREFETCH_WARM_LEAD = float(os.getenv('PREFETCH_WARM_LEAD', '30'))  # mở FFmpeg khi bài hiện tại còn ~30s
+
+warm_procs = 0
+
+
+class Prefetcher:
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.warm = None  # (url, player) của bài đứng đầu queue
+        self.ready = False  # frame đầu đã đọc xong
+        self.warm_at = 0.0
+        self.task = None
+        self.warming = None  # task warm_up FFmpeg, tách khỏi self.task để schedule() không hủy giữa chừng
+
+    def track_started(self, remaining):
+        # remaining: thời gian còn lại của bài hiện tại (duration - vị trí bắt đầu sau /seek hoặc khôi phục)
+        loop = asyncio.get_running_loop()
+        self.warm_at = loop.time() + max(0, (remaining or 0) - PREFETCH_WARM_LEAD)
+
+    def schedule(self, entries):
+        # Gọi lại mỗi khi queue đổi (play_next, /play, /shuffle, /move, /remove, /clear)
+        upcoming = [track.url for track in entries.head(PREFETCH_DEPTH)]
+        if self.warm and (not upcoming or self.warm[0] != upcoming[0]):
+            self.discard()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if upcoming:
+            self.task = asyncio.create_task(self._run(upcoming))
+
+    def peek(self, url):
+        # Như take() nhưng không lấy ra: xem trước loại source (Opus / PCM)
+        if self.warm and self.warm[0] == url and self.ready:
+            return self.warm[1]
+        return None
+
+    def take(self, url):
+        # Trả về player đã mở sẵn nếu đúng bài sắp phát
+        player = self.peek(url)
+        if player is not None:
+            self._release()
+        return player
+
+    def discard(self):
+        if self.warm:
+            _, player = self.warm
+            self._release()
+            player.cleanup()
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.discard()  # kill FFmpeg: warm_up đang chạy trả về ngay, task warming tự kết thúc
+
+    def _release(self):
+        global warm_procs
+        self.warm = None
+        self.ready = False
+        warm_procs -= 1
+
+    async def _run(self, upcoming):
+        priority.set(BACKGROUND)  # task riêng nên chỉ đổi ưu tiên của chính nó
+        try:
+            for url in upcoming:
+                # Không tranh pool với lệnh người dùng đang chờ
+                if resolver.pending >= resolver.max_pending // 2:
+                    break
+                vid = video_id(url)
+                if not audio_cache.has(vid, track_volume(loudness_table.gain(vid))):
+                    await resolver.extract(url)
+            delay = self.warm_at - asyncio.get_running_loop().time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._warm(upcoming[0])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Prefetch lỗi (guild {self.guild_id}): {e}")
+
+    async def _warm(self, url):
+        global warm_procs
+        if self.warm or warm_procs >= PREFETCH_MAX_PROCS:
+            return  # đã mở sẵn (hoặc đang warm_up) đúng bài đầu queue: schedule() bỏ warm nếu bài đầu đổi
+        warm_procs += 1
+        try:
+            player = await create_player(url)
+        except BaseException:
+            warm_procs -= 1
+            raise
+        self.warm = (url, player)
+        self.warming = asyncio.create_task(self._warm_up(url, player))
+
+    async def _warm_up(self, url, player):
+        # Task riêng: /play, /move... gọi schedule() trong lúc FFmpeg đang kết nối thì không bỏ dở warm_up
+        ok = await asyncio.to_thread(player.warm_up)
+        if self.warm and self.warm[1] is player:
+            if ok:
+                self.ready = True
+            else:
+                logger.warning(f"FFmpeg mở sẵn thất bại: {url}")
+                self.discard()
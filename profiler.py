@@ -0,0 +1,77 @@
+# profiler.py - DJ_TET sampling profiler bật theo yêu cầu (lệnh admin / signal), không tốn gì khi không chạy
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # 200 mẫu / giây
+PROFILE_MAX_SECONDS = 120
+
+_lock = asyncio.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample(seconds, interval):
+    # Chụp stack của mọi thread (event loop, AudioPlayer, radio, ...) theo chu kỳ
+    me = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[tuple(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def _write(stacks):
+    # Định dạng "collapsed stacks": dùng trực tiếp với flamegraph.pl / speedscope
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{';'.join(stack)} {count}\n")
+    return path
+
+
+def top(stacks, n=10):
+    # Hàm tốn nhiều mẫu nhất (self time = frame trên cùng của stack)
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack[-1]] += count
+    return leaves.most_common(n)
+
+
+def is_running():
+    return _lock.locked()
+
+
+async def profile(seconds=10):
+    # Trả về (đường dẫn file, số mẫu, top hàm); chỉ một phiên profile cùng lúc
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    async with _lock:
+        logger.info(f"Bắt đầu profile {seconds}s")
+        stacks, samples = await asyncio.to_thread(_sample, seconds, PROFILE_INTERVAL)
+        path = await asyncio.to_thread(_write, stacks)
+    logger.info(f"Profile xong: {path} ({samples} mẫu)")
+    return path, samples, top(stacks)
@@ -0,0 +1,101 @@
+# queue_view.py - DJ_TET /queue phân trang: chỉ render trang đang xem, cache theo version của queue
+import os
+from collections import OrderedDict
+
+import discord
+from discord import Embed
+from discord.ui import View, Button
+
+# === CẤU HÌNH ===
+QUEUE_PAGE_SIZE = int(os.getenv('QUEUE_PAGE_SIZE', '10'))
+QUEUE_VIEW_TIMEOUT = 180
+QUEUE_TITLE_MAX = 80  # 10 dòng x 80 ký tự luôn nằm trong giới hạn embed
+PAGE_CACHE_SIZE = 256
+
+_pages = OrderedDict()  # (guild_id, version, page) -> nội dung trang đã render
+
+
+def format_duration(seconds):
+    seconds = int(seconds or 0)
+    hours, rest = divmod(seconds, 3600)
+    mins, secs = divmod(rest, 60)
+    return f"{hours}:{mins:02d}:{secs:02d}" if hours else f"{mins}:{secs:02d}"
+
+
+def render_page(guild_id, queue, page):
+    # version lấy từ bộ đếm chung của process nên không lặp lại, kể cả khi queue bị tạo lại; LRU tự đẩy ra
+    key = (guild_id, queue.version, page)
+    body = _pages.get(key)
+    if body is not None:
+        _pages.move_to_end(key)
+        return body
+    start = page * QUEUE_PAGE_SIZE
+    lines = []
+    for i, track in enumerate(queue.slice(start, start + QUEUE_PAGE_SIZE), start + 1):
+        title = track.title if len(track.title) <= QUEUE_TITLE_MAX else track.title[:QUEUE_TITLE_MAX - 1] + "…"
+        lines.append(f"`{i}.` {discord.utils.escape_markdown(title)} `[{format_duration(track.duration)}]`")
+    body = "\n".join(lines)
+    _pages[key] = body
+    if len(_pages) > PAGE_CACHE_SIZE:
+        _pages.popitem(last=False)
+    return body
+
+
+class QueueView(View):
+    def __init__(self, gp):
+        super().__init__(timeout=QUEUE_VIEW_TIMEOUT)
+        self.gp = gp
+        self.page = 0
+        self.message = None
+
+    def page_count(self):
+        return max(1, -(-len(self.gp.queue) // QUEUE_PAGE_SIZE))
+
+    def render(self):
+        queue = self.gp.queue
+        pages = self.page_count()
+        self.page = min(self.page, pages - 1)  # queue ngắn đi trong lúc đang xem
+        embed = Embed(title="📜 Hàng đợi", description=render_page(self.gp.guild_id, queue, self.page) or "Hàng đợi trống!",
+                      color=0x3498db)
+        remaining = queue.total_duration
+        current = self.gp.current
+        if current:
+            left = max(0, (current['duration'] or 0) - self.gp.position())
+            remaining += left
+            title = discord.utils.escape_markdown(current['title'][:200])
+            embed.add_field(name="Đang phát", value=f"{title} (còn {format_duration(left)})", inline=False)
+        embed.set_footer(text=f"Trang {self.page + 1}/{pages} • {len(queue)} bài • "
+                              f"Tổng queue: {format_duration(queue.total_duration)} • Còn lại: {format_duration(remaining)}")
+        self.first.disabled = self.prev.disabled = self.page == 0
+        self.next.disabled = self.last.disabled = self.page >= pages - 1
+        return embed
+
+    async def _show(self, interaction, page):
+        self.page = max(0, page)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="⏮", style=discord.ButtonStyle.secondary)
+    async def first(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, 0)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.primary)
+    async def prev(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.primary)
+    async def next(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page + 1)
+
+    @discord.ui.button(label="⏭", style=discord.ButtonStyle.secondary)
+    async def last(self, interaction: discord.Interaction, button: Button):
+        await self._show(interaction, self.page_count() - 1)
+
+    async def on_timeout(self):
+        if self.message is None:
+            return
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
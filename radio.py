@@ -0,0 +1,178 @@
+# radio.py - DJ_TET chế độ radio: một nguồn Opus cho mỗi kênh, phát chung cho nhiều guild
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import discord
+from discord.opus import OPUS_SILENCE
+
+from extractor import resolver
+from player import create_opus_source
+from playlist import is_playlist_url
+from track_queue import Track
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+# RADIO_STATIONS="tet=https://www.youtube.com/playlist?list=...,lofi=https://www.youtube.com/watch?v=..."
+RADIO_STATIONS = os.getenv('RADIO_STATIONS', '')
+RADIO_BUFFER_FRAMES = int(os.getenv('RADIO_BUFFER_FRAMES', '250'))  # 5 giây Opus 20ms
+RADIO_JOIN_LAG = 3  # người nghe mới bắt đầu sau live edge vài frame để không phải chờ từng packet
+RADIO_IDLE_STOP = int(os.getenv('RADIO_IDLE_STOP', '30'))  # không ai nghe quá lâu thì tắt FFmpeg
+RADIO_MAX_TRACKS = int(os.getenv('RADIO_MAX_TRACKS', '200'))
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class RadioListener(discord.AudioSource):
+    # Mỗi voice client chỉ giữ một con trỏ vào ring buffer của station: không FFmpeg, không encode
+    def __init__(self, station):
+        self.station = station
+        self.cursor = max(0, station.seq - RADIO_JOIN_LAG)
+        self.skipped = 0
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        station = self.station
+        with station.cond:
+            if station.seq - self.cursor > len(station.frames):
+                # Tụt quá xa (voice lag / reconnect): nhảy về live edge
+                self.skipped += station.seq - self.cursor
+                self.cursor = station.seq - RADIO_JOIN_LAG
+            if self.cursor >= station.seq:
+                station.cond.wait(0.1)
+            if self.cursor >= station.seq:
+                return OPUS_SILENCE  # đang chuyển bài: giữ kết nối bằng frame im lặng
+            packet = station.frames[self.cursor % len(station.frames)]
+            self.cursor += 1
+            return packet
+
+    def cleanup(self):
+        self.station.unsubscribe(self)
+
+
+class Station:
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.tracks = []
+        self.index = 0
+        self.title = None  # bài đang phát
+        self.source = None  # FFmpeg source của bài đang phát (reaper không coi là mồ côi)
+        self.frames = [b''] * RADIO_BUFFER_FRAMES
+        self.seq = 0  # tổng số frame đã sản xuất; frame i nằm ở frames[i % RADIO_BUFFER_FRAMES]
+        self.cond = threading.Condition()
+        self.listeners = set()
+        self.failures = 0
+        self._thread = None
+        self._loop = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    async def _load(self):
+        if self.tracks:
+            return
+        if is_playlist_url(self.url):
+            batch = await resolver.playlist(self.url, 1, RADIO_MAX_TRACKS)
+            self.tracks = [Track.from_info(e) for e in batch['entries']]
+        else:
+            self.tracks = [Track.from_info(await resolver.extract(self.url))]
+        logger.info(f"Radio {self.name}: {len(self.tracks)} bài")
+
+    async def subscribe(self):
+        await self._load()
+        if not self.tracks:
+            raise ValueError(f"Radio {self.name} không có bài nào")
+        listener = RadioListener(self)
+        with self.cond:
+            self.listeners.add(listener)
+            if self._thread is None:
+                self._loop = asyncio.get_running_loop()
+                self._thread = threading.Thread(target=self._produce, name=f"radio-{self.name}", daemon=True)
+                self._thread.start()
+        return listener
+
+    def unsubscribe(self, listener):
+        with self.cond:
+            self.listeners.discard(listener)
+
+    # === PRODUCER (thread riêng, một cho mỗi station) ===
+    def _next_source(self):
+        track = self.tracks[self.index % len(self.tracks)]
+        self.index += 1
+        future = asyncio.run_coroutine_threadsafe(create_opus_source(track.url), self._loop)
+        source = future.result(timeout=resolver.timeout + 5)
+        self.title = track.title
+        self.source = source
+        logger.info(f"Radio {self.name} phát: {track.title}")
+        return source
+
+    def _produce(self):
+        source = None
+        idle_since = None
+        start, sent = time.perf_counter(), 0
+        try:
+            while True:
+                if self.listeners:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.perf_counter()
+                elif time.perf_counter() - idle_since > RADIO_IDLE_STOP:
+                    with self.cond:
+                        # Kiểm tra lại trong lock: subscribe() cũng quyết định bật thread trong lock này
+                        if not self.listeners:
+                            self._thread = None
+                            logger.info(f"Radio {self.name}: không còn ai nghe, tắt nguồn phát")
+                            return
+                if source is None:
+                    try:
+                        source = self._next_source()
+                        self.failures = 0
+                    except Exception as e:
+                        self.failures += 1
+                        logger.error(f"Radio {self.name} lỗi mở bài: {e}")
+                        time.sleep(min(30, 2 ** self.failures))
+                        continue
+                    start, sent = time.perf_counter(), 0
+                packet = source.read()
+                if not packet:
+                    source.cleanup()
+                    source = self.source = None
+                    continue
+                with self.cond:
+                    self.frames[self.seq % len(self.frames)] = packet
+                    self.seq += 1
+                    self.cond.notify_all()
+                # Giữ nhịp thời gian thực như AudioPlayer: người nghe đọc theo nhịp của producer
+                sent += 1
+                delay = start + sent * FRAME_SECONDS - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            if source is not None:
+                source.cleanup()
+            self.title = self.source = None
+            with self.cond:
+                if self._thread is threading.current_thread():
+                    self._thread = None  # thread chết vì lỗi: lần subscribe sau sẽ bật lại
+
+    def stats(self):
+        return {'listeners': len(self.listeners), 'frames': self.seq, 'title': self.title,
+                'skipped': sum(l.skipped for l in list(self.listeners))}
+
+
+def _parse_stations(spec):
+    result = {}
+    for item in spec.split(','):
+        name, sep, url = item.strip().partition('=')
+        if sep and name and url:
+            result[name.strip()] = Station(name.strip(), url.strip())
+    return result
+
+
+stations = _parse_stations(RADIO_STATIONS)
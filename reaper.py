@@ -0,0 +1,188 @@
+# reaper.py - DJ_TET dọn tài nguyên nhàn rỗi: rời voice trống / rảnh, kill FFmpeg mồ côi, bỏ state guild nguội khỏi RAM
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+import time
+import weakref
+
+from guild_player import IDLE
+from metrics import metrics
+from player import ffmpeg_sources, unwrap
+from radio import stations
+from state_store import state_store
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+REAPER_INTERVAL = float(os.getenv('REAPER_INTERVAL', '30'))
+REAPER_EMPTY_DELAY = float(os.getenv('REAPER_EMPTY_DELAY', '120'))  # kênh không còn ai ngoài bot
+REAPER_IDLE_DELAY = float(os.getenv('REAPER_IDLE_DELAY', '300'))  # ở trong voice mà không phát gì
+REAPER_EVICT_DELAY = float(os.getenv('REAPER_EVICT_DELAY', '1800'))  # rảnh và ngoài voice: bỏ khỏi RAM
+
+
+def _humans(channel):
+    return sum(1 for member in channel.members if not member.bot)
+
+
+def _alive(source):
+    proc = getattr(source, '_process', None)
+    return isinstance(proc, subprocess.Popen) and proc.poll() is None
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # không có /proc: dùng peak
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+
+class Reaper:
+    def __init__(self):
+        self.registry = None
+        self.empty_timers = {}  # guild_id -> TimerHandle rời kênh trống
+        self.idle_since = {}  # guild_id -> monotonic lúc GuildPlayer bắt đầu rảnh
+        self.suspects = weakref.WeakSet()  # source FFmpeg không ai giữ ở lần quét trước
+        self._task = None
+
+    def start(self, registry):
+        if self._task is not None:
+            return
+        self.registry = registry
+        metrics.collector(self.collect)
+        self._task = asyncio.create_task(self._run())
+
+    # === KÊNH TRỐNG (theo voice state event) ===
+    def voice_state_update(self, member, before, after):
+        if self.registry is not None and before.channel != after.channel:
+            self._check_channel(member.guild)
+
+    def _check_channel(self, guild):
+        vc = guild.voice_client
+        timer = self.empty_timers.get(guild.id)
+        if vc is None or not vc.is_connected() or _humans(vc.channel):
+            if timer is not None:
+                timer.cancel()
+                del self.empty_timers[guild.id]
+            return
+        if timer is None:
+            loop = asyncio.get_running_loop()
+            self.empty_timers[guild.id] = loop.call_later(REAPER_EMPTY_DELAY, self._on_empty, guild.id)
+
+    def _on_empty(self, guild_id):
+        self.empty_timers.pop(guild_id, None)
+        guild = self.registry.bot.get_guild(guild_id)
+        vc = guild.voice_client if guild else None
+        if vc is not None and vc.is_connected() and not _humans(vc.channel):
+            self._leave(guild_id, 'empty')
+
+    def _leave(self, guild_id, reason):
+        asyncio.create_task(self._do_leave(self.registry.get(guild_id), reason))
+
+    async def _do_leave(self, gp, reason):
+        try:
+            await gp.leave()
+        except Exception as e:
+            logger.warning(f"Reaper: không rời được voice guild {gp.guild_id}: {e}")
+            return
+        metrics.inc('dj_reaper_disconnects_total', reason=reason)
+        logger.info(f"Reaper: rời voice guild {gp.guild_id} ({reason})")
+
+    # === QUÉT ĐỊNH KỲ ===
+    async def _run(self):
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Reaper lỗi: {e}")
+
+    async def sweep(self):
+        now = time.monotonic()
+        # Bắt kịp event bị lỡ trong lúc mất kết nối gateway
+        for vc in list(self.registry.bot.voice_clients):
+            self._check_channel(vc.guild)
+        for guild_id, gp in list(self.registry.players.items()):
+            if gp.state != IDLE:
+                self.idle_since.pop(guild_id, None)
+                continue
+            idle = now - self.idle_since.setdefault(guild_id, now)
+            if gp.voice_client is not None:
+                if idle > REAPER_IDLE_DELAY:
+                    self._leave(guild_id, 'idle')
+            elif idle > REAPER_EVICT_DELAY and self.registry.evict(guild_id):
+                del self.idle_since[guild_id]
+                metrics.inc('dj_reaper_evictions_total')
+        for guild_id in [g for g in self.idle_since if g not in self.registry.players]:
+            del self.idle_since[guild_id]
+        await self._reap_ffmpeg()
+
+    def _owned(self):
+        owned = set()
+        for vc in self.registry.bot.voice_clients:
+            if vc.source is not None:
+                owned.add(id(unwrap(vc.source)))
+        for gp in self.registry.players.values():
+            if gp.current:
+                owned.add(id(unwrap(gp.current['player'])))
+                if gp.current['player'].incoming is not None:
+                    owned.add(id(unwrap(gp.current['player'].incoming[0])))  # nguồn mới chờ ghép (failover)
+            if gp.prefetch.warm:
+                owned.add(id(unwrap(gp.prefetch.warm[1])))
+            if gp.mixer is not None:
+                owned.update(id(unwrap(source)) for source in gp.mixer.sources())  # bài kế / bài đang fade out
+        for station in stations.values():
+            if station.source is not None:
+                owned.add(id(unwrap(station.source)))
+        return owned
+
+    async def _reap_ffmpeg(self):
+        # Mồ côi = FFmpeg còn chạy mà hai lần quét liền không ai giữ (lần đầu có thể đang được tạo / tua)
+        owned = self._owned()
+        orphans, suspects = [], weakref.WeakSet()
+        for source in list(ffmpeg_sources):
+            if id(source) in owned or not _alive(source):
+                continue
+            if source in self.suspects:
+                orphans.append(source)
+            else:
+                suspects.add(source)
+        self.suspects = suspects
+        for source in orphans:
+            await asyncio.to_thread(source.cleanup)  # kill + chờ process thoát
+            metrics.inc('dj_reaper_ffmpeg_killed_total')
+        if orphans:
+            logger.warning(f"Reaper: kill {len(orphans)} FFmpeg mồ côi")
+
+    # === XU HƯỚNG TÀI NGUYÊN ===
+    def collect(self):
+        bot = self.registry.bot
+        return [
+            ('dj_process_rss_bytes', {}, _rss_bytes()),
+            ('dj_process_open_fds', {}, _open_fds()),
+            ('dj_process_threads', {}, threading.active_count()),
+            ('dj_ffmpeg_processes', {}, sum(1 for s in list(ffmpeg_sources) if _alive(s))),
+            ('dj_voice_connections', {}, len(bot.voice_clients)),
+            ('dj_guild_players', {}, len(self.registry.players)),
+            ('dj_guild_players_evicted', {}, len(state_store.evicted)),
+            ('dj_reaper_empty_timers', {}, len(self.empty_timers)),
+        ]
+
+
+reaper = Reaper()
@@ -0,0 +1,120 @@
+# search.py - DJ_TET tìm kiếm nhiều backend: chỉ mục local trước, hedge pytube <-> yt-dlp
+import asyncio
+import os
+import time
+
+from extractor import resolver
+from metrics import LatencyHistogram
+from search_index import search_index
+
+# === CẤU HÌNH ===
+HEDGE_QUANTILE = float(os.getenv('HEDGE_QUANTILE', '0.95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.3'))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '1.5'))  # khi chưa đủ số liệu
+HEDGE_MIN_SAMPLES = 20
+
+
+# === BACKENDS ===
+class PytubeBackend:
+    name = 'pytube'
+
+    async def search(self, query, limit):
+        return await resolver.search(query, limit=limit)
+
+
+class YtdlpBackend:
+    name = 'ytdlp'
+
+    async def search(self, query, limit):
+        return await resolver.ytsearch(query, limit=limit)
+
+
+class HedgedSearch:
+    def __init__(self):
+        self.index = search_index
+        self._index_task = None
+        self.backends = {b.name: b for b in (PytubeBackend(), YtdlpBackend())}
+        self.latency = {name: LatencyHistogram() for name in self.backends}
+        self.local_hits = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def start(self):
+        if self._index_task is None:
+            self._index_task = asyncio.create_task(self.index.run())
+
+    def remember(self, track):
+        self.index.add(track.video_id, track.title, track.duration)
+
+    def hedge_delay(self, name):
+        hist = self.latency[name]
+        if hist.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, hist.quantile(HEDGE_QUANTILE))
+
+    async def _timed(self, name, query, limit):
+        start = time.perf_counter()
+        try:
+            results = await self.backends[name].search(query, limit)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.latency[name].errors += 1
+            raise
+        self.latency[name].observe(time.perf_counter() - start)
+        return results
+
+    async def search(self, query, limit=1, primary='pytube', timeout=None):
+        local = self.index.lookup(query, limit)
+        if local:
+            self.local_hits += 1
+            return local
+        secondary = next(name for name in self.backends if name != primary)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or resolver.timeout)
+        hedge_at = loop.time() + self.hedge_delay(primary)
+        tasks = {asyncio.create_task(self._timed(primary, query, limit)): primary}
+        hedged = False
+        error = None
+        try:
+            while True:
+                if not hedged and (not tasks or loop.time() >= hedge_at):
+                    hedged = True
+                    # Backend chính chậm quá p95 thì bắn thêm sang backend phụ (trừ khi pool đang quá tải);
+                    # backend chính lỗi/rỗng thì luôn thử backend phụ
+                    if not tasks or resolver.pending < resolver.max_pending // 2:
+                        if tasks:
+                            self.hedges += 1
+                        tasks[asyncio.create_task(self._timed(secondary, query, limit))] = secondary
+                if not tasks:
+                    break
+                now = loop.time()
+                if now >= deadline:
+                    raise asyncio.TimeoutError()
+                wait = deadline - now if hedged else min(hedge_at, deadline) - now
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is None and task.result():
+                        if name == secondary and hedged:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception() or error
+            if error is not None:
+                raise error
+            return []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        return {
+            'local_hits': self.local_hits,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'latency': {name: {'count': h.count, 'errors': h.errors, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95)}
+                        for name, h in self.latency.items()},
+        }
+
+
+searcher = HedgedSearch()
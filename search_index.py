@@ -0,0 +1,219 @@
+# search_index.py - DJ_TET chỉ mục tìm kiếm local (trigram + token, bỏ dấu tiếng Việt) trên lịch sử phát
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+
+from shared_cache import shared_cache
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', 'search_index.json.gz')
+SEARCH_INDEX_MAX_DOCS = int(os.getenv('SEARCH_INDEX_MAX_DOCS', '50000'))
+CONFIDENT_SCORE = 0.85  # điểm tối thiểu để /play dùng kết quả local thay vì tìm trên mạng
+CONFIDENT_MARGIN = 0.1  # bài nhất phải hơn bài nhì ít nhất chừng này
+CANDIDATES = 64
+NOISE = {'official', 'mv', 'music', 'video', 'lyrics', 'lyric', 'audio', 'hd', '4k', 'ft', 'feat', 'x'}
+
+
+def fold(text):
+    # "Lạc Trôi" -> "lac troi", "Đừng" -> "dung"
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+    return re.sub(r'[^0-9a-z]+', ' ', text.lower()).strip()
+
+
+def trigrams(token, partial=False):
+    padded = f" {token}" if partial else f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH, shared=shared_cache):
+        self.path = path
+        self.shared = shared  # chạy nhiều worker: index nằm trong SQLite FTS5 dùng chung, không giữ trong RAM
+        self.docs = []  # doc -> (video_id, title, duration, tokens)
+        self.by_id = {}  # video_id -> doc
+        self.postings = {}  # trigram -> set(doc)
+        self.loaded = False
+        self.dirty = False
+        self._pending = []  # bài thêm vào trong lúc đang nạp file
+
+    def __len__(self):
+        return self.shared.doc_count() if self.shared.enabled else len(self.docs)
+
+    def add(self, video_id, title, duration=0):
+        if not self.loaded:
+            self._pending.append((video_id, title, duration))
+            return
+        if self.shared.enabled:
+            self.shared.add_doc(video_id, title, duration, fold(title))
+            return
+        if video_id in self.by_id or len(self.docs) >= SEARCH_INDEX_MAX_DOCS:
+            return
+        tokens = tuple(fold(title).split())
+        doc = len(self.docs)
+        self.docs.append((video_id, title, duration, tokens))
+        self.by_id[video_id] = doc
+        for token in tokens:
+            for gram in trigrams(token):
+                self.postings.setdefault(gram, set()).add(doc)
+        self.dirty = True
+
+    # === TRA CỨU ===
+    def _score(self, doc_tokens, tokens, shared, total):
+        # Token cuối có thể đang gõ dở (autocomplete): khớp theo tiền tố
+        matched = sum(1 for t in tokens[:-1] if t in doc_tokens)
+        matched += any(d.startswith(tokens[-1]) for d in doc_tokens)
+        coverage = matched / len(tokens)
+        similarity = shared / total
+        meaningful = [t for t in doc_tokens if t not in NOISE] or doc_tokens
+        title_coverage = min(1.0, matched / len(meaningful))
+        return 0.5 * coverage + 0.3 * similarity + 0.2 * title_coverage
+
+    def _query_shared(self, tokens, grams, limit):
+        # FTS5 chỉ khớp chuỗi con >= 3 ký tự; ứng viên vẫn được chấm điểm như index trong RAM
+        terms = [t for t in tokens if len(t) >= 3]
+        if not terms:
+            return []
+        scored = []
+        for video_id, title, duration, folded in self.shared.match_docs(terms, CANDIDATES):
+            doc_tokens = tuple(folded.split())
+            doc_grams = set()
+            for token in doc_tokens:
+                doc_grams |= trigrams(token)
+            score = self._score(doc_tokens, tokens, len(grams & doc_grams), len(grams))
+            scored.append((score, {'id': video_id, 'title': title, 'duration': duration,
+                                   'url': f"https://www.youtube.com/watch?v={video_id}"}))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:limit]
+
+    def query(self, text, limit=5):
+        tokens = fold(text).split()
+        if not tokens:
+            return []
+        grams = set()
+        for token in tokens[:-1]:
+            grams |= trigrams(token)
+        grams |= trigrams(tokens[-1], partial=True)
+        if self.shared.enabled:
+            return self._query_shared(tokens, grams, limit) if self.loaded else []
+        if not self.docs:
+            return []
+        # Đếm từ trigram hiếm nhất; bỏ qua trigram quá phổ biến khi đã có đủ ứng viên
+        counts = Counter()
+        skipped = []
+        common = max(1000, len(self.docs) // 10)
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            docs = self.postings.get(gram)
+            if not docs:
+                continue
+            if len(docs) > common and len(counts) >= CANDIDATES:
+                skipped.append(docs)
+                continue
+            counts.update(docs)
+        scored = []
+        for doc, shared in counts.most_common(CANDIDATES):
+            # Trigram phổ biến không được đếm ở trên: chỉ kiểm tra cho các ứng viên
+            shared += sum(1 for docs in skipped if doc in docs)
+            scored.append((self._score(self.docs[doc][3], tokens, shared, len(grams)), doc))
+        scored.sort(reverse=True)
+        results = []
+        for score, doc in scored[:limit]:
+            video_id, title, duration, _ = self.docs[doc]
+            results.append((score, {'id': video_id, 'title': title, 'duration': duration,
+                                    'url': f"https://www.youtube.com/watch?v={video_id}"}))
+        return results
+
+    def lookup(self, text, limit=1):
+        # Chỉ trả kết quả khi đủ chắc chắn, nếu không để backend mạng tìm
+        scored = self.query(text, limit=max(limit, 2))
+        if not scored or scored[0][0] < CONFIDENT_SCORE:
+            return []
+        if len(scored) > 1 and limit == 1 and scored[0][0] - scored[1][0] < CONFIDENT_MARGIN:
+            return []
+        results = [r for score, r in scored[:limit] if score >= CONFIDENT_SCORE]
+        if len(results) < limit:
+            return []
+        return results
+
+    def suggest(self, text, limit=25):
+        return [r for _, r in self.query(text, limit)]
+
+    # === LƯU / NẠP ===
+    def _build(self):
+        # File chỉ lưu (id, title, duration); trigram dựng lại khi nạp
+        built = SearchIndex(path=None)
+        built.loaded = True
+        if self.path and os.path.exists(self.path):
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for video_id, title, duration in json.load(f):
+                    built.add(video_id, title, duration)
+        return built
+
+    def _migrate(self):
+        # Lần đầu bật shared cache: chép index từ file cũ sang SQLite
+        if self.shared.has_docs():
+            return 0
+        built = self._build()
+        for video_id, title, duration, tokens in built.docs:
+            self.shared.add_doc(video_id, title, duration, ' '.join(tokens))
+        return len(built.docs)
+
+    async def load(self):
+        # Dựng index trong thread lúc khởi động; trong lúc đó lookup() trả rỗng và bot tìm qua mạng
+        if self.shared.enabled:
+            try:
+                migrated = await asyncio.to_thread(self._migrate)
+                await self.shared.flush()
+                if migrated:
+                    logger.info(f"Search index: chép {migrated} bài sang shared cache")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Không đọc được search index: {e}")
+            self.loaded = True
+            pending, self._pending = self._pending, []
+            for item in pending:
+                self.add(*item)
+            return
+        try:
+            built = await asyncio.to_thread(self._build)
+            self.docs, self.by_id, self.postings = built.docs, built.by_id, built.postings
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được search index: {e}")
+        self.loaded = True
+        pending, self._pending = self._pending, []
+        for item in pending:
+            self.add(*item)
+        self.dirty = bool(pending)
+        logger.info(f"Search index: {len(self.docs)} bài")
+
+    def _write(self, snapshot):
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        if self.shared.enabled or not self.path or not self.dirty or not self.loaded:
+            return
+        self.dirty = False
+        snapshot = [[video_id, title, duration] for video_id, title, duration, _ in self.docs]
+        try:
+            await asyncio.to_thread(self._write, snapshot)
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"Không ghi được search index: {e}")
+
+    async def run(self, interval=60):
+        await self.load()
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+
+search_index = SearchIndex()
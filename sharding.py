@@ -0,0 +1,28 @@
+# sharding.py - DJ_TET cấu hình shard cho worker process (launcher.py truyền SHARD_IDS / SHARD_COUNT qua env)
+import os
+
+from discord.ext import commands
+
+# === CẤU HÌNH ===
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_IDS = [int(s) for s in os.getenv('SHARD_IDS', '').split(',') if s.strip()]  # để trống = chạy một process
+
+
+def shard_of(guild_id, shard_count=None):
+    # Công thức của Discord: guild thuộc shard (guild_id >> 22) % shard_count
+    return (guild_id >> 22) % (shard_count or SHARD_COUNT or 1)
+
+
+def owns(guild_id):
+    return not SHARD_IDS or shard_of(guild_id) in SHARD_IDS
+
+
+def is_primary():
+    # Slash command là toàn cục: chỉ worker giữ shard 0 sync command tree
+    return not SHARD_IDS or 0 in SHARD_IDS
+
+
+def create_bot(**kwargs):
+    if SHARD_IDS:
+        return commands.AutoShardedBot(shard_ids=SHARD_IDS, shard_count=SHARD_COUNT, **kwargs)
+    return commands.Bot(**kwargs)
@@ -0,0 +1,152 @@
+# shared_cache.py - DJ_TET cache dùng chung giữa các worker process (SQLite WAL + mmap): metadata bài hát, chỉ mục tìm kiếm
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', '')  # để trống = mỗi process tự giữ cache trong RAM
+SHARED_CACHE_MMAP = int(os.getenv('SHARED_CACHE_MMAP', str(256 * 1024 ** 2)))
+SHARED_CACHE_FLUSH_INTERVAL = float(os.getenv('SHARED_CACHE_FLUSH_INTERVAL', '1'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    duration INTEGER,
+    url TEXT,
+    webpage_url TEXT,
+    acodec TEXT,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS doc_ids (video_id TEXT PRIMARY KEY);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    video_id UNINDEXED, title UNINDEXED, duration UNINDEXED, folded, tokenize='trigram'
+);
+"""
+
+TRACK_FIELDS = ('id', 'title', 'duration', 'url', 'webpage_url', 'acodec', 'expires_at')
+
+
+class SharedCache:
+    # Đọc trên event loop (tra theo khoá, trang DB được mmap nên các worker dùng chung page cache của OS);
+    # ghi gom lại rồi đẩy xuống trong thread
+    def __init__(self, path=SHARED_CACHE_PATH):
+        self.path = path
+        self.pending_tracks = {}  # video_id -> entry chờ ghi
+        self.pending_docs = []  # (video_id, title, duration, folded)
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self._reader = None
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._task = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(f'PRAGMA mmap_size={SHARED_CACHE_MMAP}')
+        return db
+
+    def _read_db(self):
+        if self._reader is None:
+            self._reader = self._open()
+            self._reader.executescript(SCHEMA)
+        return self._reader
+
+    # === METADATA BÀI HÁT ===
+    def get_track(self, video_id):
+        self.reads += 1
+        try:
+            row = self._read_db().execute(
+                'SELECT id, title, duration, url, webpage_url, acodec, expires_at FROM tracks WHERE id = ?',
+                (video_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lỗi đọc: {e}")
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        return dict(zip(TRACK_FIELDS, row))
+
+    def put_track(self, entry):
+        self.pending_tracks[entry['id']] = tuple(entry.get(k) for k in TRACK_FIELDS)
+
+    # === CHỈ MỤC TÌM KIẾM ===
+    def add_doc(self, video_id, title, duration, folded):
+        self.pending_docs.append((video_id, title, duration, folded))
+
+    def has_docs(self):
+        try:
+            return self._read_db().execute('SELECT 1 FROM doc_ids LIMIT 1').fetchone() is not None
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lỗi đọc: {e}")
+            return True  # không chép đè khi chưa đọc được DB
+
+    def doc_count(self):
+        try:
+            return self._read_db().execute('SELECT COUNT(*) FROM doc_ids').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def match_docs(self, terms, limit):
+        # FTS5 trigram: mỗi term (>= 3 ký tự) khớp như chuỗi con, nên term gõ dở cũng khớp
+        expr = ' OR '.join(f'"{t}"' for t in terms)
+        try:
+            return self._read_db().execute(
+                'SELECT video_id, title, duration, folded FROM docs WHERE docs MATCH ? ORDER BY rank LIMIT ?',
+                (expr, limit)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache lỗi tìm kiếm: {e}")
+            return []
+
+    # === GHI ===
+    def _write(self, tracks, docs):
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open()
+                self._writer.executescript(SCHEMA)
+            db = self._writer
+            with db:
+                db.executemany('INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)', tracks)
+                for doc in docs:
+                    # doc_ids chặn trùng: nhiều worker có thể cùng thêm một bài
+                    if db.execute('INSERT OR IGNORE INTO doc_ids VALUES (?)', (doc[0],)).rowcount:
+                        db.execute('INSERT INTO docs VALUES (?, ?, ?, ?)', doc)
+        return len(tracks) + len(docs)
+
+    async def flush(self):
+        if not self.pending_tracks and not self.pending_docs:
+            return
+        tracks, self.pending_tracks = list(self.pending_tracks.values()), {}
+        docs, self.pending_docs = self.pending_docs, []
+        try:
+            self.writes += await asyncio.to_thread(self._write, tracks, docs)
+        except sqlite3.Error as e:
+            logger.warning(f"Không ghi được shared cache: {e}")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(SHARED_CACHE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.run())
+            logger.info(f"Shared cache: {self.path}")
+
+    def stats(self):
+        return {'reads': self.reads, 'hits': self.hits, 'writes': self.writes,
+                'pending': len(self.pending_tracks) + len(self.pending_docs)}
+
+
+shared_cache = SharedCache()
@@ -0,0 +1,45 @@
+# singleflight.py - DJ_TET gộp các lần resolve trùng nhau (cùng video ID / cùng từ khóa) vào một job
+import asyncio
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}  # key -> _Call đang chạy
+        self.leaders = 0  # số job thật sự chạy
+        self.collapsed = 0  # số request được gộp vào job có sẵn
+
+    async def do(self, key, fn, timeout):
+        # fn() chạy thành task riêng: một người chờ timeout/bị hủy không làm hỏng kết quả của người khác
+        call = self.calls.get(key)
+        if call is None:
+            self.leaders += 1
+            call = self.calls[key] = _Call(asyncio.create_task(fn()))
+            call.task.add_done_callback(lambda _: self._done(key, call))
+        else:
+            self.collapsed += 1
+        call.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.task), timeout)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()  # không còn ai chờ, hủy job
+
+    def _done(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def stats(self):
+        return {'in_flight': len(self.calls), 'leaders': self.leaders, 'collapsed': self.collapsed}
@@ -0,0 +1,86 @@
+# startup.py - DJ_TET đo thời gian khởi động theo từng giai đoạn, chỉ sync command tree khi schema đổi
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', '10'))  # giây từ lúc chạy process tới on_ready
+TREE_HASH_PATH = os.getenv('TREE_HASH_PATH', 'dj_tet_tree.hash')  # để trống = luôn sync
+
+
+def _process_start():
+    # Linux: lấy thời điểm process thật sự bắt đầu (trước cả khi Python import module này)
+    try:
+        with open('/proc/self/stat') as f:
+            started_ticks = int(f.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + started_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class Startup:
+    def __init__(self):
+        self.started_at = _process_start()
+        self.phases = []  # [(tên, giây tính từ lúc process bắt đầu)]
+        self.ready = False
+        self.synced = False
+
+    def mark(self, phase):
+        self.phases.append((phase, time.time() - self.started_at))
+
+    def finish(self, metrics):
+        # on_ready chạy lại mỗi lần reconnect: chỉ tính lần đầu
+        if self.ready:
+            return
+        self.ready = True
+        self.mark('ready')
+        for phase, elapsed in self.phases:
+            metrics.observe('dj_startup_seconds', elapsed, phase=phase)
+        total = self.phases[-1][1]
+        steps = ', '.join(f"{phase} {elapsed:.2f}s" for phase, elapsed in self.phases)
+        if total > STARTUP_BUDGET:
+            logger.warning(f"Khởi động {total:.2f}s, vượt ngân sách {STARTUP_BUDGET:.0f}s ({steps})")
+        else:
+            logger.info(f"Khởi động {total:.2f}s ({steps})")
+
+    # === SYNC COMMAND TREE ===
+    def tree_hash(self, bot):
+        commands = sorted((c.to_dict(bot.tree) for c in bot.tree.get_commands()), key=lambda c: c['name'])
+        schema = json.dumps({'app': bot.application_id, 'commands': commands}, sort_keys=True, default=str)
+        return hashlib.sha256(schema.encode()).hexdigest()
+
+    def _saved_hash(self):
+        try:
+            with open(TREE_HASH_PATH, encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    async def sync_tree(self, bot):
+        # Mỗi lần sync là request toàn cục, dễ bị rate limit khi restart liên tục: chỉ sync khi schema đổi
+        if self.synced:
+            return
+        digest = self.tree_hash(bot)
+        if TREE_HASH_PATH and digest == self._saved_hash():
+            self.synced = True
+            logger.info("Command tree không đổi, bỏ qua sync")
+            return
+        await bot.tree.sync()
+        self.synced = True
+        self.mark('tree_sync')
+        if TREE_HASH_PATH:
+            try:
+                with open(TREE_HASH_PATH, 'w', encoding='utf-8') as f:
+                    f.write(digest)
+            except OSError as e:
+                logger.warning(f"Không ghi được hash command tree: {e}")
+        logger.info("Đã sync command tree")
+
+
+startup = Startup()
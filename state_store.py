@@ -0,0 +1,230 @@
+# state_store.py - DJ_TET lưu queue / trạng thái phát xuống SQLite (write-behind) để khôi phục sau crash/deploy
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from sharding import SHARD_IDS, owns
+from track_queue import Track
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'dj_tet_state.db')  # để trống = không lưu trạng thái
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '2'))
+STATE_MAX_AGE = int(os.getenv('STATE_MAX_AGE', str(6 * 3600)))  # tắt quá lâu thì không vào lại voice
+STATE_REJOIN_CONCURRENCY = int(os.getenv('STATE_REJOIN_CONCURRENCY', '25'))
+# Mỗi worker một heartbeat: worker khác vẫn đang ghi thì heartbeat của chúng không phải lúc worker này tắt
+HEARTBEAT_KEY = f"saved_at:{','.join(map(str, SHARD_IDS))}" if SHARD_IDS else 'saved_at'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id INTEGER PRIMARY KEY,
+    channel_id INTEGER,
+    repeat_mode INTEGER NOT NULL DEFAULT 0,
+    settings TEXT,
+    current TEXT,
+    queue TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+"""
+
+
+def encode_tracks(tracks):
+    return json.dumps([[t.video_id, t.title, t.duration] for t in tracks], ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_tracks(raw):
+    return [Track(video_id, title, duration) for video_id, title, duration in json.loads(raw or '[]')]
+
+
+class StateStore:
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        self.rows = {}  # guild_id -> row thô từ DB, chỉ parse khi guild được dùng tới
+        self.saved_at = None  # heartbeat cuối cùng của lần chạy trước
+        self.dirty = {}  # guild_id -> GuildPlayer cần ghi
+        self.evicted = set()  # guild bị reaper bỏ khỏi RAM, state chỉ còn trong DB
+        self.loaded = False
+        self.resumed = False  # resume_all đã chạy xong: guild nạp sau đó không vào lại voice
+        self.flushes = 0
+        self.rows_written = 0
+        self._db = None
+        self._task = None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    # === NẠP ===
+    def _read(self):
+        db = self._connect()
+        # Nhiều worker dùng chung một DB: mỗi worker chỉ nhận guild thuộc shard của mình
+        rows = {row[0]: row for row in db.execute(
+            'SELECT guild_id, channel_id, repeat_mode, settings, current, queue FROM guilds') if owns(row[0])}
+        saved = db.execute('SELECT value FROM meta WHERE key = ?', (HEARTBEAT_KEY,)).fetchone()
+        return rows, saved[0] if saved else None
+
+    def _read_row(self, guild_id):
+        # Một lookup theo khoá chính, đủ nhanh để chạy thẳng trên event loop
+        try:
+            return self._connect().execute(
+                'SELECT guild_id, channel_id, repeat_mode, settings, current, queue FROM guilds WHERE guild_id = ?',
+                (guild_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Không đọc được state guild {guild_id}: {e}")
+            return None
+
+    async def load(self):
+        if not self.enabled or self.loaded:
+            return
+        start = time.perf_counter()
+        try:
+            self.rows, self.saved_at = await asyncio.to_thread(self._read)
+        except sqlite3.Error as e:
+            logger.warning(f"Không đọc được state DB: {e}")
+        self.loaded = True
+        logger.info(f"State: nạp {len(self.rows)} guild trong {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def restore(self, gp):
+        # Gọi khi GuildPlayer được tạo: parse queue của đúng guild đó
+        row = self.rows.pop(gp.guild_id, None)
+        if row is None and gp.guild_id in self.evicted:
+            self.evicted.discard(gp.guild_id)
+            row = self._read_row(gp.guild_id)
+        if row is None:
+            return None
+        _, channel_id, repeat_mode, settings, current, queue = row
+        gp.repeat_mode = repeat_mode or 0
+        gp.settings.update(json.loads(settings or '{}'))
+        gp.queue.extend(decode_tracks(queue))
+        if not current:
+            return channel_id, None, 0
+        video_id, title, duration, position, snapshot_at, paused = json.loads(current)
+        track = Track(video_id, title, duration)
+        if self.resumed:
+            gp.queue.appendleft(track)  # không còn được khôi phục phát tiếp: giữ bài dở ở đầu queue
+            return None
+        # Đang phát thì cộng thêm thời gian từ lần ghi cuối tới heartbeat cuối trước khi bot tắt
+        if not paused and self.saved_at:
+            position += max(0.0, self.saved_at - snapshot_at)
+        return channel_id, track, position
+
+    def requeue(self, gp):
+        # Guild không được vào lại voice: bài đang dở xếp lại đầu queue thay vì mất
+        _, track, _ = gp.pending_resume
+        gp.pending_resume = None
+        if track is not None:
+            gp.queue.appendleft(track)
+
+    async def resume_all(self, registry):
+        # Vào lại voice và phát tiếp cho các guild đang phát lúc bot tắt
+        try:
+            if self.saved_at and time.time() - self.saved_at <= STATE_MAX_AGE:
+                await self._resume(registry)
+        finally:
+            self.resumed = True
+            for gp in registry.players.values():
+                if gp.pending_resume is not None:
+                    self.requeue(gp)
+
+    async def _resume(self, registry):
+        start = time.perf_counter()
+        # queue rỗng vẫn được ghi thành '[]': chỉ vào lại khi còn bài đang dở hoặc còn bài chờ
+        active = [row[0] for row in self.rows.values() if row[1] and (row[4] or row[5] not in (None, '[]'))]
+        slots = asyncio.Semaphore(STATE_REJOIN_CONCURRENCY)
+
+        async def resume(guild_id):
+            async with slots:
+                gp = registry.get(guild_id)
+                if gp.pending_resume is not None:
+                    await gp.resume_session()
+
+        results = await asyncio.gather(*(resume(g) for g in active), return_exceptions=True)
+        failed = sum(1 for r in results if isinstance(r, Exception))
+        logger.info(f"State: khôi phục {len(active) - failed}/{len(active)} guild "
+                    f"trong {time.perf_counter() - start:.2f}s")
+
+    def evict(self, gp):
+        # True nếu có thể bỏ GuildPlayer khỏi RAM mà không mất gì
+        has_state = bool(gp.queue or gp.settings or gp.repeat_mode)
+        if not self.enabled:
+            return not has_state
+        if not self.loaded or gp.guild_id in self.dirty:
+            return False  # chờ lần flush sau ghi xong đã
+        if has_state:
+            self.evicted.add(gp.guild_id)  # guild không còn gì thì DB cũng đã xoá row, không cần nhớ
+        return True
+
+    # === GHI ===
+    def mark(self, gp):
+        if self.enabled:
+            self.dirty[gp.guild_id] = gp
+
+    def _snapshot(self, gp):
+        # Chỉ copy tham chiếu trên event loop; encode JSON làm trong thread
+        vc = gp.voice_client
+        channel_id = vc.channel.id if vc and vc.is_connected() else None
+        current = None
+        if gp.current:
+            track = gp.current['track']
+            current = (track.video_id, track.title, track.duration, gp.position(), time.time(), gp.state == 'paused')
+        return gp.guild_id, channel_id, gp.repeat_mode, dict(gp.settings), current, list(gp.queue)
+
+    def _write(self, snapshots, saved_at):
+        db = self._connect()
+        upserts, deletes = [], []
+        for guild_id, channel_id, repeat_mode, settings, current, tracks in snapshots:
+            if not (current or tracks or repeat_mode or settings):
+                deletes.append((guild_id,))
+                continue
+            upserts.append((guild_id, channel_id, repeat_mode, json.dumps(settings),
+                            json.dumps(current, ensure_ascii=False) if current else None,
+                            encode_tracks(tracks), saved_at))
+        with db:
+            db.executemany('INSERT OR REPLACE INTO guilds VALUES (?, ?, ?, ?, ?, ?, ?)', upserts)
+            db.executemany('DELETE FROM guilds WHERE guild_id = ?', deletes)
+            db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (HEARTBEAT_KEY, saved_at))
+        return len(upserts) + len(deletes)
+
+    async def flush(self):
+        if not self.enabled or not self.loaded:
+            return
+        dirty, self.dirty = self.dirty, {}
+        snapshots = [self._snapshot(gp) for gp in dirty.values()]
+        try:
+            self.rows_written += await asyncio.to_thread(self._write, snapshots, time.time())
+            self.flushes += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Không ghi được state DB: {e}")
+            for guild_id, gp in dirty.items():
+                self.dirty.setdefault(guild_id, gp)
+
+    async def run(self, registry, interval=STATE_FLUSH_INTERVAL):
+        await self.load()
+        asyncio.create_task(self.resume_all(registry))
+        while True:
+            await asyncio.sleep(interval)
+            # Ghi cả khi không có thay đổi: heartbeat saved_at dùng để tính vị trí phát khi crash
+            await self.flush()
+
+    def start(self, registry):
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self.run(registry))
+
+    def stats(self):
+        return {'pending': len(self.dirty), 'flushes': self.flushes, 'rows_written': self.rows_written}
+
+
+state_store = StateStore()
@@ -0,0 +1,187 @@
+# track_cache.py - DJ_TET cache metadata + stream URL theo video ID (LRU, TTL theo expire=)
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from shared_cache import shared_cache
+
+logger = logging.getLogger("DJ_TET")
+
+# === CẤU HÌNH ===
+TRACK_CACHE_MAX_ENTRIES = int(os.getenv('TRACK_CACHE_MAX_ENTRIES', '5000'))
+TRACK_CACHE_MAX_BYTES = int(os.getenv('TRACK_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+TRACK_CACHE_PATH = os.getenv('TRACK_CACHE_PATH', '')  # để trống = không lưu xuống đĩa
+TRACK_CACHE_REFRESH_MARGIN = float(os.getenv('TRACK_CACHE_REFRESH_MARGIN', '600'))
+TRACK_CACHE_DEFAULT_TTL = float(os.getenv('TRACK_CACHE_DEFAULT_TTL', '3600'))
+TRACK_CACHE_HOT_WINDOW = 3600  # chỉ làm mới bài được dùng trong 1 giờ qua
+
+FIELDS = ('id', 'title', 'duration', 'url', 'webpage_url', 'acodec')
+
+
+def expiry_from_url(url, now=None):
+    # googlevideo ghi thời điểm hết hạn (epoch) trong tham số expire=
+    now = now or time.time()
+    try:
+        expire = parse_qs(urlparse(url).query).get('expire')
+        if expire:
+            return float(expire[0])
+    except (ValueError, TypeError):
+        pass
+    return now + TRACK_CACHE_DEFAULT_TTL
+
+
+def _entry_size(entry):
+    return sum(len(str(entry.get(k) or '')) for k in FIELDS) + 64
+
+
+class TrackCache:
+    def __init__(self, max_entries=TRACK_CACHE_MAX_ENTRIES, max_bytes=TRACK_CACHE_MAX_BYTES,
+                 path=TRACK_CACHE_PATH, refresh_margin=TRACK_CACHE_REFRESH_MARGIN, shared=shared_cache):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.shared = shared  # chạy nhiều worker: miss trong RAM thì tra tiếp cache chung
+        self.entries = OrderedDict()  # video_id -> dict
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, video_id):
+        entry = self.entries.get(video_id)
+        if entry is None and self.shared.enabled:
+            entry = self._from_shared(video_id)
+        now = time.time()
+        # Stream URL phải còn sống hết bài (+1 phút) thì mới dùng được
+        if entry is None or entry['expires_at'] - now < (entry.get('duration') or 0) + 60:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry['last_used'] = now
+        self.entries.move_to_end(video_id)
+        return {k: entry.get(k) for k in FIELDS}
+
+    def _insert(self, video_id, entry, last_used):
+        old = self.entries.pop(video_id, None)
+        if old is not None:
+            self.bytes -= old['size']
+        entry['last_used'] = old['last_used'] if old else last_used
+        entry['size'] = _entry_size(entry)
+        self.entries[video_id] = entry
+        self.bytes += entry['size']
+        self._evict()
+        return entry
+
+    def _from_shared(self, video_id):
+        # Worker khác đã trích xuất bài này: copy về LRU local, không ghi ngược lại
+        entry = self.shared.get_track(video_id)
+        if entry is None or entry['expires_at'] <= time.time():
+            return None
+        return self._insert(video_id, entry, time.time())
+
+    def put(self, data):
+        video_id = data.get('id')
+        if not video_id or not data.get('url'):
+            return
+        entry = {k: data.get(k) for k in FIELDS}
+        entry['expires_at'] = expiry_from_url(entry['url'])
+        if self.shared.enabled:
+            self.shared.put_track(entry)
+        self._insert(video_id, entry, time.time())
+        self.dirty = True
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.bytes -= entry['size']
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'refreshes': self.refreshes,
+            'evictions': self.evictions,
+        }
+
+    # === LƯU XUỐNG ĐĨA ===
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được track cache: {e}")
+            return
+        now = time.time()
+        for entry in saved:
+            if entry.get('expires_at', 0) > now and entry.get('id') and entry.get('url'):
+                entry['size'] = _entry_size(entry)
+                entry.setdefault('last_used', now)
+                self.entries[entry['id']] = entry
+                self.bytes += entry['size']
+        self._evict()
+        logger.info(f"Đã nạp {len(self.entries)} bài từ track cache")
+
+    def _write(self, snapshot):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        if not self.path or not self.dirty:
+            return
+        self.dirty = False
+        snapshot = [{k: v for k, v in e.items() if k != 'size'} for e in self.entries.values()]
+        try:
+            await asyncio.to_thread(self._write, snapshot)
+        except OSError as e:
+            self.dirty = True
+            logger.warning(f"Không ghi được track cache: {e}")
+
+    # === LÀM MỚI NỀN ===
+    def due_for_refresh(self, now=None):
+        now = now or time.time()
+        return [
+            e['webpage_url'] for e in self.entries.values()
+            if e['expires_at'] - now < self.refresh_margin + (e.get('duration') or 0)
+            and now - e['last_used'] < TRACK_CACHE_HOT_WINDOW
+        ]
+
+    def prune(self, now=None):
+        now = now or time.time()
+        for video_id in [k for k, e in self.entries.items() if e['expires_at'] <= now]:
+            self.bytes -= self.entries.pop(video_id)['size']
+            self.dirty = True
+
+    async def refresh_loop(self, refresh, interval=30):
+        # refresh(url) trích xuất lại và put() vào cache
+        while True:
+            await asyncio.sleep(interval)
+            self.prune()
+            for url in self.due_for_refresh():
+                try:
+                    await refresh(url)
+                    self.refreshes += 1
+                except Exception as e:
+                    logger.warning(f"Không làm mới được {url}: {e}")
+            await self.save()
+
+
+track_cache = TrackCache()
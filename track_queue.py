@@ -0,0 +1,169 @@
+# track_queue.py - DJ_TET hàng đợi theo guild: blocked list (các deque nhỏ), pop đầu O(1)
+import random
+from collections import deque
+from itertools import count, islice
+
+BLOCK_SIZE = 256  # tách block khi dài quá 2 * BLOCK_SIZE
+
+# Chung cho mọi queue trong process: GuildPlayer bị evict rồi tạo lại không lặp lại version cũ (cache /queue)
+_versions = count(1)
+
+
+class Track:
+    __slots__ = ('video_id', 'title', 'duration')
+
+    def __init__(self, video_id, title, duration=0):
+        self.video_id = video_id
+        self.title = title
+        self.duration = duration or 0
+
+    @classmethod
+    def from_info(cls, info):
+        return cls(info['id'], info.get('title', 'Unknown'), info.get('duration', 0))
+
+    @property
+    def url(self):
+        return f"https://www.youtube.com/watch?v={self.video_id}"
+
+    def __repr__(self):
+        return f"Track({self.video_id!r}, {self.title!r}, {self.duration!r})"
+
+
+class TrackQueue:
+    def __init__(self, tracks=()):
+        self.blocks = []  # list[deque[Track]]
+        self.length = 0
+        self.total_duration = 0
+        self.version = next(_versions)  # đổi mỗi lần queue thay đổi, không trùng giữa các queue
+        self.extend(tracks)
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __getitem__(self, index):
+        block, offset = self._locate(index)
+        return self.blocks[block][offset]
+
+    def head(self, n):
+        return list(islice(self, n))
+
+    def slice(self, start, stop):
+        # Chỉ duyệt các block chứa [start, stop), dùng cho hiển thị từng trang
+        result = []
+        if start >= self.length:
+            return result
+        block, offset = self._locate(start)
+        remaining = min(stop, self.length) - start
+        while remaining > 0:
+            chunk = list(islice(self.blocks[block], offset, offset + remaining))
+            result.extend(chunk)
+            remaining -= len(chunk)
+            block, offset = block + 1, 0
+        return result
+
+    # === THÊM / BỚT ===
+    def _changed(self, added=(), removed=()):
+        self.total_duration += sum(t.duration for t in added) - sum(t.duration for t in removed)
+        self.version = next(_versions)
+
+    def append(self, track):
+        if not self.blocks or len(self.blocks[-1]) >= BLOCK_SIZE:
+            self.blocks.append(deque())
+        self.blocks[-1].append(track)
+        self.length += 1
+        self._changed(added=(track,))
+
+    def appendleft(self, track):
+        if not self.blocks or len(self.blocks[0]) >= BLOCK_SIZE:
+            self.blocks.insert(0, deque())
+        self.blocks[0].appendleft(track)
+        self.length += 1
+        self._changed(added=(track,))
+
+    def extend(self, tracks):
+        # Lấp đầy block cuối rồi cắt phần còn lại thành block mới (nhanh khi nhập playlist / khôi phục state)
+        tracks = list(tracks)
+        if not tracks:
+            return
+        i = 0
+        if self.blocks and len(self.blocks[-1]) < BLOCK_SIZE:
+            i = BLOCK_SIZE - len(self.blocks[-1])
+            self.blocks[-1].extend(tracks[:i])
+        self.blocks.extend(deque(tracks[j:j + BLOCK_SIZE]) for j in range(i, len(tracks), BLOCK_SIZE))
+        self.length += len(tracks)
+        self._changed(added=tracks)
+
+    def popleft(self):
+        if not self.length:
+            raise IndexError("pop from empty queue")
+        track = self.blocks[0].popleft()
+        if not self.blocks[0]:
+            self.blocks.pop(0)
+        self.length -= 1
+        self._changed(removed=(track,))
+        return track
+
+    def pop(self, index=-1):
+        block, offset = self._locate(index)
+        blk = self.blocks[block]
+        track = blk[offset]
+        del blk[offset]
+        if not blk:
+            self.blocks.pop(block)
+        self.length -= 1
+        self._changed(removed=(track,))
+        return track
+
+    def insert(self, index, track):
+        if index >= self.length:
+            self.append(track)
+            return
+        if index <= 0:
+            self.appendleft(track)
+            return
+        block, offset = self._locate(index)
+        blk = self.blocks[block]
+        blk.insert(offset, track)
+        if len(blk) > 2 * BLOCK_SIZE:
+            # Tách đôi để giữ insert/remove ở mức O(BLOCK_SIZE)
+            right = deque(islice(blk, BLOCK_SIZE, None))
+            for _ in range(len(right)):
+                blk.pop()
+            self.blocks.insert(block + 1, right)
+        self.length += 1
+        self._changed(added=(track,))
+
+    def move(self, src, dst):
+        track = self.pop(src)
+        self.insert(dst, track)
+        return track
+
+    def clear(self):
+        self.blocks = []
+        self.length = 0
+        self.total_duration = 0
+        self.version = next(_versions)
+
+    def shuffle(self):
+        tracks = list(self)
+        random.shuffle(tracks)
+        self.blocks = [deque(tracks[i:i + BLOCK_SIZE]) for i in range(0, len(tracks), BLOCK_SIZE)]
+        self.version = next(_versions)
+
+    def _locate(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("queue index out of range")
+        for block, blk in enumerate(self.blocks):
+            if index < len(blk):
+                return block, index
+            index -= len(blk)
+        raise IndexError("queue index out of range")